@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+Cross-validated training runner for the YAMNet embedding classifier
+
+Loads cached YAMNet embeddings, runs stratified k-fold cross-validation
+over a hyperparameter grid in a process pool, prints a leaderboard and
+exports the best configuration (retrained on all data) together with
+its normalization statistics.
+
+Usage:
+    python train_runner.py --cache features/embeddings.npz --folds 5 --workers 4
+    python train_runner.py --cache features/ --grid grid.json
+
+The cache is either an .npz file with `X` (n, 1024) raw embeddings, `y`
+(integer or one-hot labels) and optionally `class_names`, or the
+notebook's features directory (X_yamnet_{train,val,test}.npy and
+y_yamnet_{train,val,test}.npy).
+
+The notebook saves its features after scalar normalization, so a
+features directory also needs the raw mean and std it was normalized
+with. The notebook writes them, with its label names, to
+yamnet_normalization.json in the same directory; for features saved
+before it did, pass --raw-mean/--raw-std (X_yamnet_features.mean() and
+.std() after re-running the notebook's extraction cell) and
+--class-names. The raw statistics are folded into the exported
+normalization.json so the API can feed raw YAMNet embeddings to the
+model.
+
+Labels are remapped to the API's class order (API_CLASSES) before
+training and samples of other classes (e.g. the notebook's guineafowl)
+are left out, so the exported model can be deployed as is. Use
+--all-classes to train on every class in the cache instead.
+"""
+
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+# Default grid: the notebook configuration plus a few neighbours
+DEFAULT_GRID = {
+    "layers": [[512, 256, 128, 64], [1024, 512, 256], [256, 128]],
+    "dropout": [0.5, 0.3],  # first hidden layer; each later layer drops 0.1 less
+    "learning_rate": [0.001, 0.0003],
+    "batch_size": [64],
+}
+
+# Output order the API serves (THREAT_CLASSES in api/main.py)
+API_CLASSES = ["gun_shot", "human_voices", "engine_idling", "dog_bark"]
+
+NOTEBOOK_STATS_FILE = "yamnet_normalization.json"  # raw statistics saved next to the notebook's features
+
+EARLY_STOPPING_PATIENCE = 15
+REDUCE_LR_PATIENCE = 7
+VALIDATION_FRACTION = 0.15  # of each training fold, for early stopping
+SEED = 42
+
+# Set in each worker process by _init_worker
+_X = None
+_y = None
+
+
+def load_cache(path):
+    """
+    Load embeddings and integer labels from a cache
+
+    Args:
+        path: .npz file or the notebook's features directory
+
+    Returns:
+        (X, y, class_names, already_normalized)
+    """
+    path = Path(path)
+    if path.is_dir():
+        X_parts, y_parts = [], []
+        for split in ("train", "val", "test"):
+            X_parts.append(np.load(path / f"X_yamnet_{split}.npy"))
+            y_parts.append(np.load(path / f"y_yamnet_{split}.npy"))
+        X, y = np.concatenate(X_parts), np.concatenate(y_parts)
+        class_names = None
+        # The notebook saves embeddings after global normalization
+        already_normalized = True
+    else:
+        data = np.load(path, allow_pickle=False)
+        X, y = data["X"], data["y"]
+        class_names = [str(c) for c in data["class_names"]] if "class_names" in data else None
+        already_normalized = False
+
+    if y.ndim == 2:
+        y = np.argmax(y, axis=1)
+    y = y.astype(np.int64)
+
+    return X.astype(np.float32), y, class_names, already_normalized
+
+
+def load_notebook_stats(path):
+    """Raw mean, std and label names the notebook saved with its features, or None"""
+    stats_path = Path(path) / NOTEBOOK_STATS_FILE
+    if not stats_path.exists():
+        return None
+    with open(stats_path) as f:
+        return json.load(f)
+
+
+def select_classes(X, y, class_names, target_names):
+    """
+    Keep the samples of target_names, relabelled so label i is target_names[i]
+
+    Returns:
+        (X, y, dropped class names)
+
+    Raises:
+        ValueError: If a target class has no label in the cache
+    """
+    missing = [name for name in target_names if name not in class_names]
+    if missing:
+        raise ValueError(f"cache has no samples labelled {', '.join(missing)} (classes: {', '.join(class_names)})")
+    index = {name: i for i, name in enumerate(target_names)}
+    mapping = np.array([index.get(name, -1) for name in class_names], dtype=np.int64)
+    y = mapping[y]
+    keep = y >= 0
+    dropped = [name for name in class_names if name not in index]
+    return X[keep], y[keep], dropped
+
+
+def expand_grid(grid):
+    """All combinations of a {name: [values]} grid as a list of dicts"""
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def config_name(config):
+    layers = "x".join(str(units) for units in config["layers"])
+    return f"dense{layers}_do{config['dropout']}_lr{config['learning_rate']}_bs{config['batch_size']}"
+
+
+def build_yamnet_classifier(input_dim, num_classes, layers, dropout, learning_rate):
+    """
+    Build Dense Neural Network for YAMNet embeddings
+
+    Same structure as the notebook (Dense -> BatchNorm -> Dropout blocks,
+    softmax output) with the widths, dropout and learning rate as
+    parameters.
+
+    Args:
+        input_dim: Dimension of YAMNet embeddings (1024)
+        num_classes: Number of output classes
+        layers: Hidden layer widths
+        dropout: Dropout of the first hidden layer, 0.1 less per later layer
+        learning_rate: Adam learning rate
+
+    Returns:
+        Compiled Keras model
+    """
+    from tensorflow.keras.models import Sequential
+    from tensorflow.keras.layers import Dense, Dropout, BatchNormalization, Input
+    from tensorflow.keras.optimizers import Adam
+
+    model = Sequential([Input(shape=(input_dim,))])
+    for i, units in enumerate(layers):
+        model.add(Dense(units, activation="relu"))
+        model.add(BatchNormalization())
+        model.add(Dropout(max(dropout - 0.1 * i, 0.0)))
+    model.add(Dense(num_classes, activation="softmax"))
+
+    model.compile(
+        optimizer=Adam(learning_rate=learning_rate),
+        loss="categorical_crossentropy",
+        metrics=["accuracy"]
+    )
+    return model
+
+
+def _init_worker(threads, X, y):
+    """Pin each worker to a fixed thread count and keep the dataset in-process"""
+    global _X, _y
+
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTRAOP_THREADS"] = str(threads)
+    os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    _X, _y = X, y
+
+
+def _fit(config, X_train, y_train, num_classes, epochs, seed):
+    """Fit one model with early stopping on a stratified validation split"""
+    import tensorflow as tf
+    from sklearn.model_selection import train_test_split
+    from tensorflow.keras.callbacks import EarlyStopping, ReduceLROnPlateau
+    from tensorflow.keras.utils import to_categorical
+
+    tf.keras.utils.set_random_seed(seed)
+
+    # Scalar statistics, as in the notebook, from training data only
+    mean, std = float(X_train.mean()), float(X_train.std())
+    X_train = (X_train - mean) / std
+
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        X_train, y_train, test_size=VALIDATION_FRACTION, random_state=seed, stratify=y_train
+    )
+
+    model = build_yamnet_classifier(
+        X_train.shape[1], num_classes, config["layers"], config["dropout"], config["learning_rate"]
+    )
+    history = model.fit(
+        X_fit, to_categorical(y_fit, num_classes),
+        validation_data=(X_val, to_categorical(y_val, num_classes)),
+        epochs=epochs,
+        batch_size=config["batch_size"],
+        callbacks=[
+            EarlyStopping(monitor="val_loss", patience=EARLY_STOPPING_PATIENCE, restore_best_weights=True),
+            ReduceLROnPlateau(monitor="val_loss", factor=0.5, patience=REDUCE_LR_PATIENCE, min_lr=1e-7),
+        ],
+        verbose=0
+    )
+    return model, mean, std, len(history.history["loss"])
+
+
+def run_trial(config_index, config, fold, train_idx, test_idx, num_classes, epochs):
+    """Train on one fold and score on its held-out part (runs in a worker)"""
+    from sklearn.metrics import precision_recall_fscore_support
+
+    start = time.perf_counter()
+    model, mean, std, epochs_trained = _fit(config, _X[train_idx], _y[train_idx], num_classes, epochs, SEED + fold)
+    train_seconds = time.perf_counter() - start
+
+    probabilities = model.predict((_X[test_idx] - mean) / std, verbose=0)
+    predicted = np.argmax(probabilities, axis=1)
+    precision, recall, f1, support = precision_recall_fscore_support(
+        _y[test_idx], predicted, labels=range(num_classes), zero_division=0
+    )
+
+    return {
+        "config_index": config_index,
+        "fold": fold,
+        "accuracy": float(np.mean(predicted == _y[test_idx])),
+        "precision": precision.tolist(),
+        "recall": recall.tolist(),
+        "f1": f1.tolist(),
+        "support": support.tolist(),
+        "train_seconds": train_seconds,
+        "epochs_trained": epochs_trained,
+    }
+
+
+def train_final(config, num_classes, epochs, export_dir, raw_stats=None):
+    """
+    Retrain a configuration on all data and export it (runs in a worker)
+
+    Args:
+        raw_stats: (mean, std) the cached features were already normalized
+            with, or None if the cache holds raw embeddings
+    """
+    start = time.perf_counter()
+    model, mean, std, epochs_trained = _fit(config, _X, _y, num_classes, epochs, SEED)
+    train_seconds = time.perf_counter() - start
+
+    if raw_stats is not None:
+        # ((x - raw_mean) / raw_std - mean) / std, as one scalar transform of raw embeddings
+        raw_mean, raw_std = raw_stats
+        mean, std = raw_mean + raw_std * mean, raw_std * std
+
+    export_dir = Path(export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    model.save(export_dir / "model.keras")
+    with open(export_dir / "normalization.json", "w") as f:
+        json.dump({"mean": mean, "std": std}, f, indent=2)
+
+    return {"train_seconds": train_seconds, "epochs_trained": epochs_trained}
+
+
+def summarize(config, trials, class_names):
+    """Average the fold results of one configuration"""
+    def mean_std(key):
+        values = np.array([t[key] for t in trials], dtype=np.float64)
+        return float(values.mean()), float(values.std())
+
+    f1 = np.array([t["f1"] for t in trials])
+    precision = np.array([t["precision"] for t in trials])
+    recall = np.array([t["recall"] for t in trials])
+    accuracy, accuracy_std = mean_std("accuracy")
+    train_seconds, _ = mean_std("train_seconds")
+    epochs_trained, _ = mean_std("epochs_trained")
+
+    return {
+        "name": config_name(config),
+        "config": config,
+        "folds": len(trials),
+        "accuracy": accuracy,
+        "accuracy_std": accuracy_std,
+        "macro_f1": float(f1.mean(axis=1).mean()),
+        "per_class": {
+            name: {
+                "precision": float(precision[:, i].mean()),
+                "recall": float(recall[:, i].mean()),
+                "f1": float(f1[:, i].mean()),
+            }
+            for i, name in enumerate(class_names)
+        },
+        "train_seconds_per_fold": train_seconds,
+        "epochs_per_fold": epochs_trained,
+    }
+
+
+def print_leaderboard(leaderboard, class_names):
+    header = f"{'#':>2}  {'configuration':40s} {'macro F1':>8} {'accuracy':>14} {'s/fold':>7}  " + " ".join(f"{n[:12]:>12}" for n in class_names)
+    print("\n" + "=" * len(header))
+    print("LEADERBOARD (mean over folds, per-class columns are F1)")
+    print("=" * len(header))
+    print(header)
+    for rank, row in enumerate(leaderboard, 1):
+        per_class = " ".join(f"{row['per_class'][n]['f1']:12.3f}" for n in class_names)
+        print(f"{rank:>2}  {row['name']:40s} {row['macro_f1']:8.3f} {row['accuracy']:7.3f} ±{row['accuracy_std']:.3f} {row['train_seconds_per_fold']:7.1f}  {per_class}")
+    print("=" * len(header))
+
+
+def write_leaderboard(leaderboard, class_names, output_dir):
+    with open(output_dir / "leaderboard.json", "w") as f:
+        json.dump(leaderboard, f, indent=2)
+
+    with open(output_dir / "leaderboard.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["rank", "name", "macro_f1", "accuracy", "accuracy_std", "train_seconds_per_fold", "epochs_per_fold"]
+            + [f"{n}_{m}" for n in class_names for m in ("precision", "recall", "f1")]
+        )
+        for rank, row in enumerate(leaderboard, 1):
+            writer.writerow(
+                [rank, row["name"], row["macro_f1"], row["accuracy"], row["accuracy_std"],
+                 row["train_seconds_per_fold"], row["epochs_per_fold"]]
+                + [row["per_class"][n][m] for n in class_names for m in ("precision", "recall", "f1")]
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validated grid search for the YAMNet classifier")
+    parser.add_argument("--cache", required=True, help=".npz embedding cache or the notebook's features directory")
+    parser.add_argument("--grid", default=None, help="JSON file of {parameter: [values]} (default: built-in grid)")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--epochs", type=int, default=100, help="Maximum epochs per trial (early stopping applies)")
+    parser.add_argument("--threads-per-trial", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None, help="Parallel trials (default: CPU cores / threads per trial)")
+    parser.add_argument("--output", default="training_runs", help="Directory for the leaderboard and exported model")
+    parser.add_argument("--raw-mean", type=float, default=None,
+                        help=f"Mean the notebook normalized its features with, if {NOTEBOOK_STATS_FILE} is missing")
+    parser.add_argument("--raw-std", type=float, default=None,
+                        help=f"Std the notebook normalized its features with, if {NOTEBOOK_STATS_FILE} is missing")
+    parser.add_argument("--class-names", default=None,
+                        help="Comma-separated name of each label index in the cache, in order "
+                             "(the notebook's yamnet_class_names)")
+    parser.add_argument("--all-classes", action="store_true",
+                        help="Train on every class in the cache, in cache order, instead of the API's classes")
+    args = parser.parse_args()
+
+    from sklearn.model_selection import StratifiedKFold
+
+    X, y, class_names, already_normalized = load_cache(args.cache)
+    raw_stats = None
+    if already_normalized:
+        saved = load_notebook_stats(args.cache) or {}
+        class_names = class_names or saved.get("class_names")
+        raw_mean = args.raw_mean if args.raw_mean is not None else saved.get("mean")
+        raw_std = args.raw_std if args.raw_std is not None else saved.get("std")
+        # Statistics of normalized features would make the API skip the notebook's normalization
+        if raw_mean is None or raw_std is None:
+            parser.error(f"the notebook's features are already normalized and {NOTEBOOK_STATS_FILE} is missing; "
+                         "pass --raw-mean and --raw-std (X_yamnet_features.mean() and .std() after re-running "
+                         "the notebook's extraction cell), or use an .npz cache of raw embeddings")
+        if raw_std <= 0:
+            parser.error("--raw-std must be positive")
+        raw_stats = (float(raw_mean), float(raw_std))
+    elif args.raw_mean is not None or args.raw_std is not None:
+        parser.error("--raw-mean/--raw-std only apply to the notebook's features directory")
+
+    if args.class_names:
+        class_names = [name.strip() for name in args.class_names.split(",")]
+    num_labels = int(y.max()) + 1
+    if class_names is not None and len(class_names) != num_labels:
+        parser.error(f"{len(class_names)} class names given but the cache has {num_labels} labels")
+    if args.all_classes:
+        class_names = class_names or [f"class_{i}" for i in range(num_labels)]
+    else:
+        # The API reads output i as API_CLASSES[i], whatever order the cache uses
+        if class_names is None:
+            parser.error("the cache does not name its labels; pass --class-names (or --all-classes)")
+        try:
+            X, y, dropped = select_classes(X, y, class_names, API_CLASSES)
+        except ValueError as e:
+            parser.error(str(e))
+        class_names = list(API_CLASSES)
+        if dropped:
+            print(f"Leaving out classes the API does not serve: {', '.join(dropped)}")
+    num_classes = len(class_names)
+    grid = DEFAULT_GRID
+    if args.grid:
+        with open(args.grid) as f:
+            grid = {**DEFAULT_GRID, **json.load(f)}
+    configs = expand_grid(grid)
+    workers = args.workers or max(1, (os.cpu_count() or 1) // args.threads_per_trial)
+
+    output_dir = Path(args.output) / datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    print("=" * 70)
+    print("YAMNET CLASSIFIER CROSS-VALIDATION")
+    print("=" * 70)
+    print(f"Samples: {len(X):,}  Features: {X.shape[1]}  Classes: {', '.join(class_names)}")
+    print(f"Configurations: {len(configs)}  Folds: {args.folds}  Trials: {len(configs) * args.folds}")
+    print(f"Workers: {workers} x {args.threads_per_trial} thread(s)")
+    print(f"Output: {output_dir}")
+    if raw_stats:
+        print(f"Features normalized by the notebook with mean {raw_stats[0]:.6f}, std {raw_stats[1]:.6f}")
+    print("=" * 70)
+
+    folds = list(StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=SEED).split(X, y))
+    trials = {i: [] for i in range(len(configs))}
+
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")  # TensorFlow is not fork-safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(args.threads_per_trial, X, y)) as pool:
+        futures = [
+            pool.submit(run_trial, i, config, fold, train_idx, test_idx, num_classes, args.epochs)
+            for i, config in enumerate(configs)
+            for fold, (train_idx, test_idx) in enumerate(folds)
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            trials[result["config_index"]].append(result)
+            print(f"  [{done}/{len(futures)}] {config_name(configs[result['config_index']])} fold {result['fold']}: "
+                  f"accuracy {result['accuracy']:.3f} ({result['train_seconds']:.1f}s, {result['epochs_trained']} epochs)")
+
+        leaderboard = sorted(
+            (summarize(configs[i], trials[i], class_names) for i in trials),
+            key=lambda row: row["macro_f1"],
+            reverse=True
+        )
+        print_leaderboard(leaderboard, class_names)
+        write_leaderboard(leaderboard, class_names, output_dir)
+
+        best = leaderboard[0]
+        export_dir = output_dir / "best"
+        print(f"\n🚀 Retraining best configuration on all data: {best['name']}")
+        final = pool.submit(train_final, best["config"], num_classes, args.epochs, str(export_dir), raw_stats).result()
+
+    with open(export_dir / "metadata.json", "w") as f:
+        json.dump({
+            "name": best["name"],
+            "config": best["config"],
+            "class_names": class_names,
+            "cross_validation": {k: best[k] for k in ("folds", "accuracy", "accuracy_std", "macro_f1", "per_class")},
+            "final_training": final,
+            "samples": len(X),
+            "trained_at": datetime.datetime.now().isoformat(),
+        }, f, indent=2)
+
+    print(f"\n✓ Done in {(time.perf_counter() - start) / 60:.1f} minutes")
+    print(f"  Leaderboard: {output_dir / 'leaderboard.csv'}")
+    print(f"  Best model:  {export_dir / 'model.keras'} (+ normalization.json, metadata.json)")
+    if args.all_classes:
+        print("  Trained with --all-classes: the API only loads models with its own classes")
+    else:
+        print(f"  Deploy: copy {export_dir} to api/models/<version>/ and POST /models/<version>/shadow")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the inference pipeline
+
+Times each stage on its own (decode, resample, YAMNet, classifier)
+across backends, batch sizes, clip lengths and thread counts. Results
+include latency distributions, peak RSS and classifier output parity
+against the Keras reference, and are saved as a JSON baseline that
+later runs can be compared against.
+
+Usage:
+    python benchmark.py run --output baseline.json
+    python benchmark.py run --output current.json --threads 1,4 --batch-sizes 1,32
+    python benchmark.py compare baseline.json current.json --tolerance 0.15
+
+Every (stage, thread count) pair runs in a fresh subprocess, so thread
+settings take effect before TensorFlow starts and peak RSS is measured
+per stage. Only the yamnet and classifier stages load TensorFlow; decode
+and resample threads are set through OMP_NUM_THREADS.
+"""
+
+import argparse
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from config import KERAS_MODEL_PATH, MODEL_REGISTRY_DIR, SAMPLE_RATE, YAMNET_MODEL_URL, process_peak_rss_mb
+
+STAGES = ("decode", "resample", "yamnet", "classifier")
+TF_STAGES = ("yamnet", "classifier")  # the only stages that load TensorFlow
+CLASSIFIER_BACKENDS = ("keras_predict", "keras_call", "tflite", "numpy")
+SOURCE_SAMPLE_RATE = 44100  # typical field-recorder / phone rate, resampled to 16kHz
+PARITY_ATOL = 1e-4  # max |probability difference| a backend may have vs keras_predict
+
+
+def latency_summary(samples_ms: List[float]) -> Dict[str, float]:
+    values = np.array(samples_ms, dtype=np.float64)
+    return {
+        "n": int(len(values)),
+        "mean": float(values.mean()),
+        "std": float(values.std()),
+        "min": float(values.min()),
+        "p50": float(np.percentile(values, 50)),
+        "p90": float(np.percentile(values, 90)),
+        "p99": float(np.percentile(values, 99)),
+        "max": float(values.max()),
+    }
+
+
+def time_call(fn: Callable[[], Any], repeats: int, warmup: int) -> Dict[str, float]:
+    """Latency distribution of fn() in milliseconds, after warm-up calls"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return latency_summary(samples)
+
+
+def synthetic_clip(seconds: float, sample_rate: int) -> np.ndarray:
+    """Deterministic chirp plus noise, so every run decodes the same audio"""
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    chirp = 0.4 * np.sin(2 * np.pi * (200 + 1800 * t / max(seconds, 1e-6)) * t)
+    return (chirp + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+
+
+def synthetic_wav(seconds: float, sample_rate: int) -> bytes:
+    import soundfile as sf
+
+    buffer = io.BytesIO()
+    sf.write(buffer, synthetic_clip(seconds, sample_rate), sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+class NumpyClassifier:
+    """
+    Pure-NumPy forward pass of the Dense/BatchNorm/Dropout classifier
+
+    Weights are copied out of the Keras model once. Each inference-mode
+    BatchNormalization (a per-feature scale and shift after a ReLU) is
+    folded into the Dense layer that follows it.
+    """
+
+    def __init__(self, keras_model):
+        self.layers = []  # (weights, bias, activation)
+        scale, shift = None, None
+        for layer in keras_model.layers:
+            kind = type(layer).__name__
+            if kind == "Dense":
+                weights, bias = [w.astype(np.float32) for w in layer.get_weights()]
+                if scale is not None:
+                    bias = bias + shift @ weights
+                    weights = scale[:, None] * weights
+                    scale, shift = None, None
+                self.layers.append((weights, bias, layer.get_config()["activation"]))
+            elif kind == "BatchNormalization":
+                gamma, beta, mean, var = layer.get_weights()
+                scale = (gamma / np.sqrt(var + layer.epsilon)).astype(np.float32)
+                shift = (beta - mean * scale).astype(np.float32)
+            elif kind in ("Dropout", "InputLayer"):
+                continue
+            else:
+                raise ValueError(f"Unsupported layer for NumPy backend: {kind}")
+        if scale is not None:
+            self.layers.append((np.diag(scale), shift, "linear"))
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        x = np.asarray(x, dtype=np.float32)
+        for weights, bias, activation in self.layers:
+            x = x @ weights + bias
+            if activation == "relu":
+                np.maximum(x, 0, out=x)
+            elif activation == "softmax":
+                x = np.exp(x - x.max(axis=1, keepdims=True))
+                x /= x.sum(axis=1, keepdims=True)
+        return x
+
+
+class TFLiteClassifier:
+    """TFLite interpreter resized to a fixed batch size"""
+
+    def __init__(self, model_content: bytes, batch_size: int, threads: int, input_dim: int = 1024):
+        import tensorflow as tf
+
+        self.interpreter = tf.lite.Interpreter(model_content=model_content, num_threads=threads)
+        input_index = self.interpreter.get_input_details()[0]["index"]
+        self.interpreter.resize_tensor_input(input_index, [batch_size, input_dim])
+        self.interpreter.allocate_tensors()
+        self.input_index = input_index
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+
+    def predict(self, x: np.ndarray) -> np.ndarray:
+        self.interpreter.set_tensor(self.input_index, np.asarray(x, dtype=np.float32))
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output_index)
+
+
+def parity(reference: np.ndarray, output: np.ndarray) -> Dict[str, Any]:
+    max_abs_diff = float(np.max(np.abs(reference - output)))
+    return {
+        "max_abs_diff": max_abs_diff,
+        "argmax_agreement": float(np.mean(np.argmax(reference, axis=1) == np.argmax(output, axis=1))),
+        "ok": max_abs_diff <= PARITY_ATOL,
+    }
+
+
+def load_keras_classifier(model_path: str):
+    import tensorflow as tf
+    return tf.keras.models.load_model(model_path)
+
+
+def bench_decode(config, threads) -> List[Dict[str, Any]]:
+    import librosa
+    import soundfile as sf
+
+    results = []
+    for seconds in config["clip_seconds"]:
+        wav = synthetic_wav(seconds, SOURCE_SAMPLE_RATE)
+        backends = {
+            "soundfile": lambda: sf.read(io.BytesIO(wav), dtype="float32"),
+            "librosa": lambda: librosa.load(io.BytesIO(wav), sr=None, mono=True),
+        }
+        for backend, fn in backends.items():
+            results.append({"backend": backend, "clip_seconds": seconds, "batch_size": 1,
+                            "latency_ms": time_call(fn, config["repeats"], config["warmup"])})
+    return results
+
+
+def bench_resample(config, threads) -> List[Dict[str, Any]]:
+    import librosa
+
+    results = []
+    for seconds in config["clip_seconds"]:
+        clip = synthetic_clip(seconds, SOURCE_SAMPLE_RATE)
+        for res_type in ("soxr_hq", "polyphase"):
+            fn = lambda: librosa.resample(clip, orig_sr=SOURCE_SAMPLE_RATE, target_sr=16000, res_type=res_type)
+            try:
+                latency = time_call(fn, config["repeats"], config["warmup"])
+            except Exception as e:
+                results.append({"backend": res_type, "clip_seconds": seconds, "batch_size": 1, "skipped": str(e)})
+                continue
+            results.append({"backend": res_type, "clip_seconds": seconds, "batch_size": 1, "latency_ms": latency})
+    return results
+
+
+def bench_yamnet(config, threads) -> List[Dict[str, Any]]:
+    import tensorflow_hub as hub
+
+    yamnet_model = hub.load(YAMNET_MODEL_URL)
+    results = []
+    for seconds in config["clip_seconds"]:
+        clip = synthetic_clip(seconds, SAMPLE_RATE)
+        clip /= np.max(np.abs(clip))
+        fn = lambda: yamnet_model(clip)[1].numpy()
+        results.append({"backend": "tf_hub", "clip_seconds": seconds, "batch_size": 1,
+                        "latency_ms": time_call(fn, config["repeats"], config["warmup"])})
+    return results
+
+
+def bench_classifier(config, threads) -> List[Dict[str, Any]]:
+    import tensorflow as tf
+
+    model = load_keras_classifier(config["model"])
+    input_dim = model.input_shape[-1]
+    rng = np.random.default_rng(0)
+
+    if config.get("tflite"):
+        with open(config["tflite"], "rb") as f:
+            tflite_content = f.read()
+    else:
+        tflite_content = tf.lite.TFLiteConverter.from_keras_model(model).convert()
+    numpy_model = NumpyClassifier(model)
+
+    results = []
+    for batch_size in config["batch_sizes"]:
+        x = rng.standard_normal((batch_size, input_dim)).astype(np.float32)
+        reference = model.predict(x, verbose=0)
+        tflite_model = TFLiteClassifier(tflite_content, batch_size, threads, input_dim)
+
+        backends = {
+            "keras_predict": lambda: model.predict(x, verbose=0),
+            "keras_call": lambda: model(x, training=False).numpy(),
+            "tflite": lambda: tflite_model.predict(x),
+            "numpy": lambda: numpy_model.predict(x),
+        }
+        for backend in config["backends"]:
+            fn = backends[backend]
+            latency = time_call(fn, config["repeats"], config["warmup"])
+            results.append({
+                "backend": backend,
+                "clip_seconds": None,
+                "batch_size": batch_size,
+                "latency_ms": latency,
+                "throughput_per_s": batch_size * 1000 / latency["p50"],
+                "parity": parity(reference, np.asarray(fn())),
+            })
+    return results
+
+
+STAGE_FUNCTIONS = {
+    "decode": bench_decode,
+    "resample": bench_resample,
+    "yamnet": bench_yamnet,
+    "classifier": bench_classifier,
+}
+
+
+def run_stage_in_process(stage: str, threads: int, config: Dict[str, Any]):
+    """Child entry point: pin threads, run one stage, print JSON results"""
+    if stage in TF_STAGES:
+        # Other stages never import TensorFlow, so their peak RSS is their own
+        import tensorflow as tf
+
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    results = STAGE_FUNCTIONS[stage](config, threads)
+    rss = process_peak_rss_mb()
+    for result in results:
+        result.update({"stage": stage, "threads": threads, "peak_rss_mb": rss})
+    json.dump(results, sys.stdout)
+
+
+def run_benchmarks(args):
+    model_path = args.model
+    if model_path is None:
+        from model_registry import ModelRegistry
+        registry = ModelRegistry(MODEL_REGISTRY_DIR)
+        version = registry.active_version()
+        model_path = registry.model_path(version) if version else KERAS_MODEL_PATH
+
+    config = {
+        "model": model_path,
+        "tflite": args.tflite,
+        "batch_sizes": [int(b) for b in args.batch_sizes.split(",")],
+        "clip_seconds": [float(s) for s in args.clip_seconds.split(",")],
+        "backends": [b for b in args.backends.split(",") if b],
+        "repeats": args.repeats,
+        "warmup": args.warmup,
+    }
+    thread_counts = [int(t) for t in args.threads.split(",")]
+    stages = [s for s in args.stages.split(",") if s]
+
+    results = []
+    for stage in stages:
+        for threads in thread_counts:
+            print(f"Running {stage} with {threads} thread(s)...", file=sys.stderr)
+            env = dict(os.environ,
+                       OMP_NUM_THREADS=str(threads),
+                       TF_NUM_INTRAOP_THREADS=str(threads),
+                       TF_NUM_INTEROP_THREADS="1",
+                       TF_CPP_MIN_LOG_LEVEL="2")
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "stage", stage, str(threads), json.dumps(config)],
+                env=env, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            if child.returncode != 0:
+                print(child.stderr, file=sys.stderr)
+                raise SystemExit(f"{stage} benchmark failed with {threads} thread(s)")
+            results.extend(json.loads(child.stdout))
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "config": config,
+            "thread_counts": thread_counts,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_results(results)
+    print(f"\n✓ Results saved to {args.output}")
+
+
+def result_key(result: Dict[str, Any]) -> tuple:
+    return (result["stage"], result["backend"], result["threads"], result["batch_size"], result["clip_seconds"])
+
+
+def describe(key: tuple) -> str:
+    stage, backend, threads, batch_size, clip_seconds = key
+    shape = f"batch {batch_size}" if clip_seconds is None else f"{clip_seconds:g}s clip"
+    return f"{stage}/{backend} {shape} x{threads}t"
+
+
+def print_results(results: List[Dict[str, Any]]):
+    print(f"\n{'benchmark':44s} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'RSS MB':>8}  parity")
+    for result in results:
+        if "skipped" in result:
+            print(f"{describe(result_key(result)):44s} skipped: {result['skipped']}")
+            continue
+        latency = result["latency_ms"]
+        check = result.get("parity")
+        parity_text = "" if check is None else f"{'ok' if check['ok'] else 'FAIL'} ({check['max_abs_diff']:.1e})"
+        print(f"{describe(result_key(result)):44s} {latency['p50']:9.3f} {latency['p90']:9.3f} {latency['p99']:9.3f} {result['peak_rss_mb']:8.1f}  {parity_text}")
+
+
+def compare(args) -> int:
+    """Flag latency, memory and parity regressions; returns the exit code"""
+    with open(args.baseline) as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"] if "skipped" not in r}
+    with open(args.current) as f:
+        current = {result_key(r): r for r in json.load(f)["results"] if "skipped" not in r}
+
+    regressions = []
+    print(f"{'benchmark':44s} {'base p50':>9} {'now p50':>9} {'change':>8}")
+    for key in sorted(set(baseline) & set(current), key=str):
+        before, after = baseline[key], current[key]
+        change = after["latency_ms"]["p50"] / before["latency_ms"]["p50"] - 1
+        flags = []
+        if change > args.tolerance:
+            flags.append("SLOWER")
+        if after["peak_rss_mb"] > before["peak_rss_mb"] * (1 + args.memory_tolerance):
+            flags.append(f"RSS {before['peak_rss_mb']:.0f}->{after['peak_rss_mb']:.0f} MB")
+        if after.get("parity") and not after["parity"]["ok"]:
+            flags.append(f"PARITY {after['parity']['max_abs_diff']:.1e}")
+        if flags:
+            regressions.append((key, flags))
+        print(f"{describe(key):44s} {before['latency_ms']['p50']:9.3f} {after['latency_ms']['p50']:9.3f} {change:+8.1%}  {' '.join(flags)}")
+
+    for key in sorted(set(baseline) - set(current), key=str):
+        print(f"{describe(key):44s} missing from current run")
+
+    print()
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%} latency / {args.memory_tolerance:.0%} memory tolerance")
+        return 1
+    print("✅ No regressions")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EcoSight inference microbenchmarks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run benchmarks and save a JSON baseline")
+    run_parser.add_argument("--output", required=True)
+    run_parser.add_argument("--model", default=None, help="Classifier .keras file (default: the API's active model)")
+    run_parser.add_argument("--tflite", default=None, help="TFLite classifier (default: converted from --model)")
+    run_parser.add_argument("--stages", default=",".join(STAGES))
+    run_parser.add_argument("--backends", default=",".join(CLASSIFIER_BACKENDS), help="Classifier backends")
+    run_parser.add_argument("--batch-sizes", default="1,8,32,128")
+    run_parser.add_argument("--clip-seconds", default="1,4,10")
+    run_parser.add_argument("--threads", default="1,2,4")
+    run_parser.add_argument("--repeats", type=int, default=50)
+    run_parser.add_argument("--warmup", type=int, default=5)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files and flag regressions")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed p50 latency increase")
+    compare_parser.add_argument("--memory-tolerance", type=float, default=0.20, help="Allowed peak RSS increase")
+
+    stage_parser = subparsers.add_parser("stage")  # internal: one stage in a fresh process
+    stage_parser.add_argument("stage", choices=STAGES)
+    stage_parser.add_argument("threads", type=int)
+    stage_parser.add_argument("config")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run_benchmarks(args)
+    elif args.command == "compare":
+        sys.exit(compare(args))
+    else:
+        run_stage_in_process(args.stage, args.threads, json.loads(args.config))
+
+
+if __name__ == "__main__":
+    main()
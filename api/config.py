@@ -0,0 +1,45 @@
+"""
+Model and audio settings shared by the API and its offline tools
+
+Kept free of heavy imports so scan_recordings.py and benchmark.py can
+read them without building the FastAPI app or loading TensorFlow.
+"""
+
+import os
+import resource
+import sys
+
+KERAS_MODEL_PATH = "/Users/cococe/Desktop/TogetherSO_Wildlife/togetherso_yamnet_model_v2_improved.keras"
+YAMNET_MODEL_URL = 'https://tfhub.dev/google/yamnet/1'
+MODEL_REGISTRY_DIR = os.environ.get(
+    "MODEL_REGISTRY_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "models")
+)
+
+# Threat classes mapping
+THREAT_CLASSES = {
+    0: "gun_shot",
+    1: "human_voices",
+    2: "engine_idling",
+    3: "dog_bark"
+}
+
+# Priority mapping
+PRIORITY_MAP = {
+    "gun_shot": "CRITICAL",
+    "human_voices": "HIGH",
+    "engine_idling": "MEDIUM",
+    "dog_bark": "LOW"
+}
+
+# Audio preprocessing parameters
+SAMPLE_RATE = 16000  # YAMNet uses 16kHz
+MAX_DURATION = 4  # seconds (same as training)
+EMBEDDING_DIM = 1024  # YAMNet embedding size
+
+
+def process_peak_rss_mb() -> float:
+    """Peak resident memory of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS, KiB on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
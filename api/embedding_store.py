@@ -0,0 +1,402 @@
+"""
+Embedding store and similarity search for past detections
+
+Pooled YAMNet embeddings are persisted next to their detection IDs so
+analysts can look up past recordings that sound like a new one.
+
+On-disk layout (one directory):
+    vectors.f16          append-only float16 matrix, one L2-normalized row per detection
+    ids.txt              detection IDs, one per line, in row order
+    ivf_centroids.npy    IVF cluster centroids (optional)
+    ivf_assignments.npy  cluster of each indexed row (optional)
+
+Small stores are searched exactly with a vectorized scan of the
+memory-mapped matrix. Once the store passes IVF_MIN_VECTORS rows, an
+IVF (inverted file) index partitions the rows into clusters and a query
+only scans the nprobe clusters nearest to it; rows appended after the
+index was built are scanned exactly until the next rebuild.
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f16"
+IDS_FILE = "ids.txt"
+CENTROIDS_FILE = "ivf_centroids.npy"
+ASSIGNMENTS_FILE = "ivf_assignments.npy"
+
+EMBEDDING_DIM = 1024
+IVF_MIN_VECTORS = 50_000  # below this an exact scan is fast enough
+IVF_REBUILD_FRACTION = 0.25  # rebuild once unindexed rows exceed this share of indexed rows
+DEFAULT_NPROBE = 32  # clusters scanned per IVF query
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64  # training rows per cluster
+KMEANS_MAX_SAMPLE = 65536
+SCAN_CHUNK_ROWS = 65536  # rows converted to float32 at a time during scans
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows so cosine similarity becomes a dot product"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the most similar centroid for each row, in bounded-memory chunks"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), 8192):
+        chunk = np.asarray(vectors[start:start + 8192], dtype=np.float32)
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def _top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the k best (scores, rows), best first"""
+    if len(scores) > k:
+        keep = np.argpartition(-scores, k - 1)[:k]
+        scores, rows = scores[keep], rows[keep]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], rows[order]
+
+
+class EmbeddingStore:
+    """
+    Append-only, memory-mapped store of detection embeddings
+
+    Args:
+        directory: Directory holding the store files (created if missing)
+        dim: Embedding dimension
+    """
+
+    def __init__(self, directory: str, dim: int = EMBEDDING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self.row_bytes = dim * np.dtype(np.float16).itemsize
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._matrix: Optional[np.memmap] = None
+        self._matrix_rows = 0
+        self._centroids: Optional[np.ndarray] = None
+        self._list_rows: Optional[np.ndarray] = None  # indexed rows sorted by cluster
+        self._list_offsets: Optional[np.ndarray] = None  # start of each cluster in _list_rows
+        self._indexed_rows = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, VECTORS_FILE)
+        self._ids_path = os.path.join(directory, IDS_FILE)
+        self._ids: List[str] = []
+        self._row_of: Dict[str, int] = {}
+        self._recover()
+        self._load_ivf()
+
+    def _recover(self):
+        """Load IDs and drop any half-written trailing row or ID from a crash"""
+        torn_id = False
+        if os.path.exists(self._ids_path):
+            with open(self._ids_path, "r") as f:
+                lines = f.readlines()
+            # A last line without its newline is an ID cut off mid-write
+            torn_id = bool(lines) and not lines[-1].endswith("\n")
+            if torn_id:
+                lines.pop()
+            self._ids = [line.rstrip("\n") for line in lines if line.strip()]
+        vector_bytes = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        vector_rows = vector_bytes // self.row_bytes
+
+        count = min(vector_rows, len(self._ids))
+        # A partial row must go too, or every later append lands at a misaligned offset
+        if count * self.row_bytes != vector_bytes or count != len(self._ids) or torn_id:
+            logger.warning(
+                f"Embedding store out of sync ({vector_bytes} vector bytes, {len(self._ids)} ids), "
+                f"truncating to {count} rows"
+            )
+            with open(self._vectors_path, "ab") as f:
+                f.truncate(count * self.row_bytes)
+            self._ids = self._ids[:count]
+            with open(self._ids_path, "w") as f:
+                f.writelines(f"{i}\n" for i in self._ids)
+
+        self._row_of = {detection_id: row for row, detection_id in enumerate(self._ids)}
+        logger.info(f"✓ Embedding store opened: {count} vectors in {self.directory}")
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, detection_id: str) -> bool:
+        return detection_id in self._row_of
+
+    def append(self, detection_ids: List[str], embeddings: np.ndarray):
+        """
+        Persist embeddings for new detections
+
+        Args:
+            detection_ids: One detection ID per row
+            embeddings: Array of shape (n, dim)
+        """
+        embeddings = np.asarray(embeddings).reshape(-1, self.dim)
+        if len(detection_ids) != len(embeddings):
+            raise ValueError(f"{len(detection_ids)} ids for {len(embeddings)} embeddings")
+
+        rows = _normalize(embeddings).astype("<f2")
+        with self._lock:
+            # Vectors first: a crash between the writes leaves an extra vector, which _recover drops
+            with open(self._vectors_path, "ab") as f:
+                f.write(rows.tobytes())
+            with open(self._ids_path, "a") as f:
+                f.writelines(f"{i}\n" for i in detection_ids)
+            for detection_id in detection_ids:
+                self._row_of[detection_id] = len(self._ids)
+                self._ids.append(detection_id)
+
+    def matrix(self) -> np.ndarray:
+        """Memory-mapped (n, dim) float16 view of every stored row"""
+        with self._lock:
+            n = len(self._ids)
+            if self._matrix is None or self._matrix_rows != n:
+                self._matrix = np.memmap(self._vectors_path, dtype="<f2", mode="r", shape=(n, self.dim)) if n else np.empty((0, self.dim), dtype="<f2")
+                self._matrix_rows = n
+            return self._matrix
+
+    def vector(self, detection_id: str) -> np.ndarray:
+        """Stored (normalized) embedding for a detection ID"""
+        return self.matrix()[self._row_of[detection_id]].astype(np.float32)
+
+    # ------------------------------------------------------------------
+    # Search
+    # ------------------------------------------------------------------
+
+    def _scan(self, matrix: np.ndarray, query: np.ndarray, start: int, stop: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top-k over the contiguous rows [start, stop)"""
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        for chunk_start in range(start, stop, SCAN_CHUNK_ROWS):
+            chunk_stop = min(chunk_start + SCAN_CHUNK_ROWS, stop)
+            scores = matrix[chunk_start:chunk_stop].astype(np.float32) @ query
+            scores, rows = _top_k(scores, np.arange(chunk_start, chunk_stop), k)
+            best_scores, best_rows = _top_k(np.concatenate([best_scores, scores]), np.concatenate([best_rows, rows]), k)
+        return best_scores, best_rows
+
+    def _probe(self, matrix: np.ndarray, query: np.ndarray, k: int, nprobe: int, ivf: tuple) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top-k over the indexed rows via the nprobe nearest clusters"""
+        centroids, list_rows, offsets = ivf
+        nprobe = min(nprobe, len(centroids))
+        nearest = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+
+        candidates = np.concatenate([list_rows[offsets[c]:offsets[c + 1]] for c in nearest])
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        candidates.sort()  # sequential reads from the memmap
+        scores = matrix[candidates].astype(np.float32) @ query
+        return _top_k(scores, candidates, k)
+
+    def search(
+        self,
+        query: np.ndarray,
+        top_k: int = 10,
+        nprobe: int = DEFAULT_NPROBE,
+        exact: bool = False,
+        exclude_id: Optional[str] = None
+    ) -> Tuple[List[Tuple[str, float]], str]:
+        """
+        Find the stored detections most similar to a query embedding
+
+        Args:
+            query: Embedding of shape (dim,) or (1, dim)
+            top_k: Number of results
+            nprobe: Clusters scanned when the IVF index is used
+            exact: Force an exact scan even when an index exists
+            exclude_id: Detection ID to leave out (e.g. the query itself)
+
+        Returns:
+            ([(detection_id, cosine_similarity), ...], method) best first,
+            where method is "exact" or "ivf"
+        """
+        query = _normalize(np.asarray(query).reshape(1, self.dim))[0]
+        k = top_k + (1 if exclude_id is not None else 0)
+        matrix = self.matrix()
+        n = len(matrix)
+        if n == 0:
+            return [], "exact"
+
+        with self._lock:
+            ivf = (self._centroids, self._list_rows, self._list_offsets)
+            indexed = self._indexed_rows if self._centroids is not None else 0
+        if exact or indexed < IVF_MIN_VECTORS:
+            scores, rows = self._scan(matrix, query, 0, n, k)
+            method = "exact"
+        else:
+            ivf_scores, ivf_rows = self._probe(matrix, query, k, nprobe, ivf)
+            tail_scores, tail_rows = self._scan(matrix, query, indexed, n, k)
+            scores, rows = _top_k(np.concatenate([ivf_scores, tail_scores]), np.concatenate([ivf_rows, tail_rows]), k)
+            method = "ivf"
+
+        results = [(self._ids[row], float(score)) for score, row in zip(scores, rows) if self._ids[row] != exclude_id]
+        return results[:top_k], method
+
+    # ------------------------------------------------------------------
+    # IVF index
+    # ------------------------------------------------------------------
+
+    def needs_reindex(self) -> bool:
+        """Whether the store is large enough, and the index stale enough, to rebuild"""
+        n = len(self)
+        if n < IVF_MIN_VECTORS:
+            return False
+        if self._centroids is None:
+            return True
+        return n - self._indexed_rows > IVF_REBUILD_FRACTION * self._indexed_rows
+
+    def _set_ivf(self, centroids: np.ndarray, assignments: np.ndarray):
+        list_rows = np.argsort(assignments, kind="stable")
+        offsets = np.searchsorted(assignments[list_rows], np.arange(len(centroids) + 1))
+        with self._lock:
+            self._centroids = centroids
+            self._list_rows = list_rows
+            self._list_offsets = offsets
+            self._indexed_rows = len(assignments)
+
+    def _load_ivf(self):
+        centroids_path = os.path.join(self.directory, CENTROIDS_FILE)
+        assignments_path = os.path.join(self.directory, ASSIGNMENTS_FILE)
+        if not (os.path.exists(centroids_path) and os.path.exists(assignments_path)):
+            return
+        centroids = np.load(centroids_path)
+        assignments = np.load(assignments_path)
+        if len(assignments) > len(self):
+            logger.warning("IVF index covers more rows than the store, ignoring it")
+            return
+        self._set_ivf(centroids, assignments)
+        logger.info(f"✓ IVF index loaded: {len(centroids)} clusters over {len(assignments)} vectors")
+
+    def build_ivf(self, nlist: Optional[int] = None, seed: int = 0) -> bool:
+        """
+        (Re)build the IVF index over every row currently in the store
+
+        Runs spherical k-means on a sample of rows, assigns every row to
+        its nearest centroid and atomically replaces the index files. Safe
+        to call from a background thread while searches and appends go on.
+
+        Args:
+            nlist: Number of clusters (default ~sqrt(n))
+            seed: Random seed for sampling and initialization
+
+        Returns:
+            True if an index was built, False if one is already being built
+        """
+        if not self._build_lock.acquire(blocking=False):
+            return False
+        try:
+            start_time = time.perf_counter()
+            matrix = self.matrix()
+            n = len(matrix)
+            if n == 0:
+                return False
+            nlist = nlist or int(np.clip(np.sqrt(n), 16, 4096))
+            nlist = min(nlist, n)
+            logger.info(f"Building IVF index: {n} vectors, {nlist} clusters...")
+
+            rng = np.random.default_rng(seed)
+            sample_size = min(n, nlist * KMEANS_SAMPLE_PER_LIST, KMEANS_MAX_SAMPLE)
+            sample = matrix[np.sort(rng.choice(n, sample_size, replace=False))].astype(np.float32)
+            centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+            for _ in range(KMEANS_ITERATIONS):
+                labels = _nearest(sample, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                empty = np.bincount(labels, minlength=nlist) == 0
+                # Re-seed empty clusters from random sample rows
+                sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+                centroids = _normalize(sums)
+
+            assignments = _nearest(matrix, centroids)
+
+            for name, array in ((CENTROIDS_FILE, centroids), (ASSIGNMENTS_FILE, assignments)):
+                tmp_path = os.path.join(self.directory, f".{name}.tmp")
+                with open(tmp_path, "wb") as f:
+                    np.save(f, array)
+                os.replace(tmp_path, os.path.join(self.directory, name))
+            self._set_ivf(centroids, assignments)
+
+            logger.info(f"✓ IVF index built in {time.perf_counter() - start_time:.1f}s")
+            return True
+        finally:
+            self._build_lock.release()
+
+    def build_ivf_async(self) -> bool:
+        """Start build_ivf in a background thread unless one is running"""
+        if self._build_lock.locked():
+            return False
+        threading.Thread(target=self.build_ivf, name="ivf-build", daemon=True).start()
+        return True
+
+
+def benchmark(num_vectors: int, num_queries: int, top_k: int, nprobe: int, directory: Optional[str] = None):
+    """Fill a store with clustered synthetic vectors and time exact vs IVF queries"""
+    directory = directory or tempfile.mkdtemp(prefix="embedding_store_bench_")
+    store = EmbeddingStore(directory)
+    rng = np.random.default_rng(0)
+
+    if len(store) < num_vectors:
+        print(f"Writing {num_vectors - len(store):,} synthetic vectors to {directory}...")
+        centers = rng.standard_normal((2048, EMBEDDING_DIM)).astype(np.float32)
+        for start in range(len(store), num_vectors, 100_000):
+            count = min(100_000, num_vectors - start)
+            vectors = centers[rng.integers(0, len(centers), count)] + 0.5 * rng.standard_normal((count, EMBEDDING_DIM)).astype(np.float32)
+            store.append([str(i) for i in range(start, start + count)], vectors)
+
+    if store.needs_reindex():
+        store.build_ivf()
+
+    queries = store.matrix()[rng.integers(0, len(store), num_queries)].astype(np.float32)
+    queries += 0.1 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    timings = {"exact": [], "ivf": []}
+    found = {"exact": [], "ivf": []}
+    for query in queries:
+        for method in ("exact", "ivf"):
+            start = time.perf_counter()
+            results, used = store.search(query, top_k=top_k, nprobe=nprobe, exact=(method == "exact"))
+            timings[method].append((time.perf_counter() - start) * 1000)
+            found[method].append({detection_id for detection_id, _ in results})
+
+    recall = np.mean([len(a & e) / len(e) for a, e in zip(found["ivf"], found["exact"])])
+    print(f"\nStore: {len(store):,} vectors, top_k={top_k}, nprobe={nprobe}, queries={num_queries}")
+    for method in ("exact", "ivf"):
+        ms = np.array(timings[method])
+        print(f"  {method:5s}  p50 {np.percentile(ms, 50):8.2f} ms   p95 {np.percentile(ms, 95):8.2f} ms")
+    print(f"  IVF recall@{top_k} vs exact: {recall:.3f}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Embedding store maintenance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    reindex_parser = subparsers.add_parser("reindex", help="Rebuild the IVF index of a store")
+    reindex_parser.add_argument("directory")
+    reindex_parser.add_argument("--nlist", type=int, default=None)
+
+    bench_parser = subparsers.add_parser("bench", help="Measure query latency on synthetic vectors")
+    bench_parser.add_argument("--vectors", type=int, default=1_000_000)
+    bench_parser.add_argument("--queries", type=int, default=50)
+    bench_parser.add_argument("--top-k", type=int, default=10)
+    bench_parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE)
+    bench_parser.add_argument("--directory", default=None, help="Reuse a store directory between runs")
+
+    args = parser.parse_args()
+    if args.command == "reindex":
+        EmbeddingStore(args.directory).build_ivf(nlist=args.nlist)
+    else:
+        benchmark(args.vectors, args.queries, args.top_k, args.nprobe, args.directory)
@@ -0,0 +1,313 @@
+"""
+Asynchronous batch jobs backed by SQLite
+
+A submission is spooled to disk and recorded as a job with one row per
+file. Worker threads claim queued files in batches (from any job, oldest
+first), hand them to a processing callback, and write the per-file
+results back. Jobs and results survive restarts; files that were being
+processed when the server stopped are queued again on startup.
+
+On-disk layout (one directory):
+    jobs.sqlite3          Job and per-file state
+    spool/<job_id>/       Uploaded files, removed once the job completes
+"""
+
+import datetime
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DATABASE_FILE = "jobs.sqlite3"
+SPOOL_DIR = "spool"
+POLL_SECONDS = 5.0  # workers re-check the queue at least this often
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    total_files INTEGER NOT NULL,
+    latitude REAL,
+    longitude REAL
+);
+CREATE TABLE IF NOT EXISTS job_files (
+    job_id TEXT NOT NULL REFERENCES jobs(id),
+    file_index INTEGER NOT NULL,
+    filename TEXT,
+    spool_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    detection_id TEXT,
+    predicted_class TEXT,
+    confidence REAL,
+    priority TEXT,
+    all_predictions TEXT,
+    error TEXT,
+    finished_at TEXT,
+    PRIMARY KEY (job_id, file_index)
+);
+CREATE INDEX IF NOT EXISTS job_files_status ON job_files (status, job_id);
+"""
+
+# Job status: queued -> running -> completed
+# File status: queued -> processing -> done | error
+
+
+def now() -> str:
+    return datetime.datetime.now().isoformat()
+
+
+class JobStore:
+    """
+    Job and per-file result state in a SQLite database
+
+    One connection is shared by the API and the workers; every statement
+    runs under a lock, so claims and result writes are atomic.
+
+    Args:
+        directory: Job directory (created if missing)
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.spool_root = os.path.join(directory, SPOOL_DIR)
+        os.makedirs(self.spool_root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, DATABASE_FILE), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+
+    def spool_dir(self, job_id: str) -> str:
+        return os.path.join(self.spool_root, job_id)
+
+    def create_job(self, job_id: str, files: List[Dict[str, str]], latitude: float, longitude: float):
+        """
+        Record a new queued job
+
+        Args:
+            job_id: Unique job ID
+            files: One {"filename", "spool_path"} dict per spooled upload
+            latitude: GPS latitude applied to every detection
+            longitude: GPS longitude applied to every detection
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, created_at, total_files, latitude, longitude) VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, now(), len(files), latitude, longitude)
+            )
+            self._db.executemany(
+                "INSERT INTO job_files (job_id, file_index, filename, spool_path, status) VALUES (?, ?, ?, ?, 'queued')",
+                [(job_id, i, f["filename"], f["spool_path"]) for i, f in enumerate(files)]
+            )
+
+    def requeue_interrupted(self) -> int:
+        """Queue files left mid-processing by a previous run; returns how many"""
+        with self._lock, self._db:
+            return self._db.execute("UPDATE job_files SET status = 'queued' WHERE status = 'processing'").rowcount
+
+    def claim_batch(self, batch_size: int) -> Optional[Dict[str, Any]]:
+        """
+        Mark up to batch_size queued files of the oldest unfinished job as processing
+
+        Returns:
+            {"job": job row, "files": file rows}, or None if nothing is queued
+        """
+        with self._lock, self._db:
+            job = self._db.execute(
+                "SELECT jobs.* FROM jobs WHERE status != 'completed' AND EXISTS "
+                "(SELECT 1 FROM job_files WHERE job_id = jobs.id AND status = 'queued') "
+                "ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if job is None:
+                return None
+            files = self._db.execute(
+                "SELECT * FROM job_files WHERE job_id = ? AND status = 'queued' ORDER BY file_index LIMIT ?",
+                (job["id"], batch_size)
+            ).fetchall()
+            self._db.executemany(
+                "UPDATE job_files SET status = 'processing' WHERE job_id = ? AND file_index = ?",
+                [(job["id"], f["file_index"]) for f in files]
+            )
+            if job["status"] == "queued":
+                self._db.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (now(), job["id"]))
+            return {"job": dict(job), "files": [dict(f, status="processing") for f in files]}
+
+    def record_results(self, job_id: str, results: List[Dict[str, Any]]) -> bool:
+        """
+        Store per-file outcomes and complete the job once no file is left
+
+        Args:
+            job_id: Job the files belong to
+            results: One dict per file with "file_index" and either an
+                "error" key (the file failed, whatever its message) or
+                the detection fields
+
+        Returns:
+            True if this call completed the job
+        """
+        finished = now()
+        with self._lock, self._db:
+            self._db.executemany(
+                "UPDATE job_files SET status = ?, detection_id = ?, predicted_class = ?, confidence = ?, "
+                "priority = ?, all_predictions = ?, error = ?, finished_at = ? WHERE job_id = ? AND file_index = ?",
+                [(
+                    "error" if "error" in r else "done",
+                    r.get("detection_id"),
+                    r.get("predicted_class"),
+                    r.get("confidence"),
+                    r.get("priority"),
+                    json.dumps(r["all_predictions"]) if r.get("all_predictions") else None,
+                    r.get("error"),
+                    finished,
+                    job_id,
+                    r["file_index"]
+                ) for r in results]
+            )
+            remaining = self._db.execute(
+                "SELECT COUNT(*) FROM job_files WHERE job_id = ? AND status IN ('queued', 'processing')", (job_id,)
+            ).fetchone()[0]
+            if remaining:
+                return False
+            return self._db.execute(
+                "UPDATE jobs SET status = 'completed', finished_at = ? WHERE id = ? AND status != 'completed'",
+                (finished, job_id)
+            ).rowcount > 0
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job row plus per-status file counts, or None if unknown"""
+        with self._lock:
+            job = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM job_files WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall())
+        job = dict(job)
+        job["files"] = {status: counts.get(status, 0) for status in ("queued", "processing", "done", "error")}
+        return job
+
+    def results(self, job_id: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+        """One page of per-file results, in submission order"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT file_index, filename, status, detection_id, predicted_class, confidence, priority, "
+                "all_predictions, error, finished_at FROM job_files WHERE job_id = ? "
+                "ORDER BY file_index LIMIT ? OFFSET ?",
+                (job_id, limit, offset)
+            ).fetchall()
+        page = []
+        for row in rows:
+            result = dict(row)
+            if result["all_predictions"]:
+                result["all_predictions"] = json.loads(result["all_predictions"])
+            page.append(result)
+        return page
+
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs in each status"""
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def remove_spool(self, job_id: str):
+        shutil.rmtree(self.spool_dir(job_id), ignore_errors=True)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class JobWorkerPool:
+    """
+    Threads that drain the job queue in batches
+
+    Args:
+        store: Job store to claim files from
+        process_batch: Called with (job, files); returns one result dict
+            per file (see JobStore.record_results)
+        workers: Number of worker threads
+        batch_size: Files claimed and processed together
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        process_batch: Callable[[Dict[str, Any], List[Dict[str, Any]]], List[Dict[str, Any]]],
+        workers: int,
+        batch_size: int
+    ):
+        self.store = store
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self._wakeup = threading.Condition()
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def notify(self):
+        """Wake idle workers after a submission"""
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stop claiming work and wait for the current batches to finish
+
+        Args:
+            timeout: Seconds to wait for all workers, or None to wait indefinitely
+
+        Returns:
+            True if every worker finished; files of a batch still running
+            are requeued by requeue_interrupted on the next start
+        """
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            if thread.is_alive():
+                thread.join(None if deadline is None else max(deadline - time.monotonic(), 0))
+        return not any(thread.is_alive() for thread in self._threads)
+
+    def _run(self):
+        while not self._stopping:
+            try:
+                claimed = self.store.claim_batch(self.batch_size)
+            except Exception as e:
+                logger.error(f"Error claiming job files: {e}")
+                claimed = None
+            if claimed is None:
+                with self._wakeup:
+                    if not self._stopping:
+                        self._wakeup.wait(POLL_SECONDS)
+                continue
+            self._process(claimed["job"], claimed["files"])
+
+    def _process(self, job: Dict[str, Any], files: List[Dict[str, Any]]):
+        try:
+            results = self.process_batch(job, files)
+        except Exception as e:
+            # A batch-level failure fails its files, not the whole job
+            logger.error(f"Job {job['id']} batch error: {e}")
+            results = [{"file_index": f["file_index"], "error": str(e) or type(e).__name__} for f in files]
+        try:
+            if self.store.record_results(job["id"], results):
+                self.store.remove_spool(job["id"])
+                logger.info(f"✓ Job {job['id']} completed ({job['total_files']} files)")
+        except Exception as e:
+            logger.error(f"Error recording results for job {job['id']}: {e}")
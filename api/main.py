@@ -3,19 +3,34 @@ FastAPI Backend for EcoSight Wildlife Threat Detection
 Uses YAMNet model to classify audio threats
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 import numpy as np
 import librosa
 import io
 import datetime
+import shutil
+import tempfile
+from collections import deque
+import struct
+import threading
+import time
+import uuid
 from typing import Optional, Dict, Any, List
 from pydantic import BaseModel
 import logging
 import os
+import soundfile as sf
 import tensorflow_hub as hub
 import tensorflow as tf
+from embedding_store import EmbeddingStore
+from model_registry import ModelRegistry, ShadowEvaluator, load_and_warm_model
+from jobs import JobStore, JobWorkerPool
+from config import (
+    KERAS_MODEL_PATH, YAMNET_MODEL_URL, MODEL_REGISTRY_DIR, THREAT_CLASSES, PRIORITY_MAP,
+    SAMPLE_RATE, MAX_DURATION, EMBEDDING_DIM, process_peak_rss_mb
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -38,30 +53,57 @@ app.add_middleware(
 )
 
 # Global variables
-KERAS_MODEL_PATH = "/Users/cococe/Desktop/TogetherSO_Wildlife/togetherso_yamnet_model_v2_improved.keras"
-YAMNET_MODEL_URL = 'https://tfhub.dev/google/yamnet/1'
 keras_classifier = None  # Keras model for classification
 yamnet_model = None  # YAMNet for feature extraction
+EMBEDDING_STORE_DIR = os.environ.get(
+    "EMBEDDING_STORE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_store")
+)
+embedding_store = None  # Past detection embeddings for similarity search
+DEFAULT_MODEL_VERSION = "default"  # KERAS_MODEL_PATH, used while the registry is empty
+model_registry = None  # Versioned classifiers on local disk
+active_model_version = None
+active_model_path = None
+shadow_evaluator = None  # Candidate model compared against live traffic
+model_swap_lock = threading.Lock()
+model_loads: Dict[str, Dict[str, Any]] = {}  # background load status by version
+JOB_DIR = os.environ.get(
+    "JOB_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs")
+)
+job_store = None  # Queued batch jobs and their per-file results
+job_workers = None
+
+# Compact ingest parameters (raw PCM16 and precomputed embeddings)
+PCM16_BYTES_PER_SAMPLE = 2
+FLOAT16_BYTES = 2
+BATCH_LENGTH_PREFIX_BYTES = 4  # little-endian uint32 before each record
+MAX_BATCH_RECORDS = 256  # clips or embeddings per request
 
-# Threat classes mapping
-THREAT_CLASSES = {
-    0: "gun_shot",
-    1: "human_voices",
-    2: "engine_idling",
-    3: "dog_bark"
-}
+# Upload limits (bounded-memory streaming reads)
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024  # per file / request body
+MAX_BATCH_UPLOAD_BYTES = 100 * 1024 * 1024  # per batch request
+UPLOAD_CHUNK_BYTES = 64 * 1024  # bytes pulled from the upload at a time
+DECODE_BLOCK_FRAMES = 16384  # frames decoded at a time before checking the window
+MULTIPART_OVERHEAD_BYTES = 1024 * 1024  # form boundaries and part headers on top of file bytes
 
-# Priority mapping
-PRIORITY_MAP = {
-    "gun_shot": "CRITICAL",
-    "human_voices": "HIGH",
-    "engine_idling": "MEDIUM",
-    "dog_bark": "LOW"
-}
+# Asynchronous batch jobs
+MAX_JOB_FILES = 1000  # files per job submission
+MAX_JOB_UPLOAD_BYTES = 2 * 1024 * 1024 * 1024  # per job submission, spooled to disk
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_BATCH_SIZE = 32  # files decoded and classified together
+JOB_RESULTS_MAX_PAGE = 500
+JOB_SHUTDOWN_SECONDS = 30  # wait for running batches before exiting
 
-# Audio preprocessing parameters
-SAMPLE_RATE = 16000  # YAMNet uses 16kHz
-MAX_DURATION = 4  # seconds (same as training)
+# Per-request memory metrics (most recent requests only)
+METRICS_WINDOW = 1000
+request_memory_peaks = deque(maxlen=METRICS_WINDOW)
+request_memory_lock = threading.Lock()
+request_count = 0
+
+# Detection IDs are millisecond timestamps, bumped when several are created in the same millisecond
+_detection_id_lock = threading.Lock()
+_last_detection_id = 0
 
 
 class DetectionResponse(BaseModel):
@@ -77,6 +119,21 @@ class DetectionResponse(BaseModel):
     all_predictions: Dict[str, float]
 
 
+class SimilarDetection(BaseModel):
+    """One past detection returned by a similarity search"""
+    id: str
+    similarity: float
+
+
+class SimilarityResponse(BaseModel):
+    """Response model for similarity search"""
+    query_id: Optional[str]
+    method: str
+    query_ms: float
+    total_vectors: int
+    results: List[SimilarDetection]
+
+
 class HealthResponse(BaseModel):
     """Health check response"""
     status: str
@@ -84,9 +141,190 @@ class HealthResponse(BaseModel):
     timestamp: str
 
 
+class MemoryTracker:
+    """
+    Track the audio buffers one request holds at once
+    
+    Counts upload chunks and decoded samples as they are allocated and
+    released so the peak per request can be reported in /metrics.
+    """
+    
+    def __init__(self):
+        self.current = 0
+        self.peak = 0
+    
+    def hold(self, nbytes: int):
+        self.current += nbytes
+        self.peak = max(self.peak, self.current)
+    
+    def release(self, nbytes: int):
+        self.current -= nbytes
+
+
+class BoundedReader(io.RawIOBase):
+    """
+    Read-only file wrapper that refuses to read past a byte limit
+    
+    Lets decoders pull from an upload incrementally while guaranteeing
+    no more than `limit` bytes are ever consumed. Reads stop at the limit
+    as if the file ended there: soundfile calls readinto from a cffi
+    callback that swallows exceptions, so oversized uploads are rejected
+    up front by check_upload_size instead.
+    """
+    
+    def __init__(self, fileobj, limit: int):
+        self._file = fileobj
+        self._limit = limit
+        self.bytes_read = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return self._file.seekable()
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+    
+    def tell(self):
+        return self._file.tell()
+    
+    def readinto(self, buffer):
+        remaining = max(self._limit - self._file.tell(), 0)
+        data = self._file.read(min(len(buffer), remaining))
+        buffer[:len(data)] = data
+        self.bytes_read += len(data)
+        return len(data)
+
+
+def multipart_limit(path: str) -> int:
+    """Largest multipart body accepted for an endpoint"""
+    limits = {
+        "/batch-predict": MAX_BATCH_UPLOAD_BYTES,
+        "/jobs": MAX_JOB_UPLOAD_BYTES
+    }
+    return limits.get(path, MAX_UPLOAD_BYTES) + MULTIPART_OVERHEAD_BYTES
+
+
+class UploadLimitMiddleware:
+    """
+    Reject oversized multipart uploads before they are spooled
+    
+    Starlette writes a whole multipart body to disk before the endpoint
+    runs, so per-file checks alone come too late. Bodies that declare a
+    Content-Length over the endpoint's limit get 413 straight away, and
+    chunked bodies are cut off with 413 as soon as they pass it.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if not headers.get(b"content-type", b"").startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+        
+        limit = multipart_limit(scope["path"])
+        declared = headers.get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > limit:
+            response = JSONResponse(
+                status_code=413,
+                content={"detail": f"Request body is {int(declared)} bytes (max {limit})"}
+            )
+            return await response(scope, receive, send)
+        
+        received = 0
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside form parsing, which FastAPI passes through as a 413 response
+                    raise HTTPException(status_code=413, detail=f"Request body exceeds {limit} bytes")
+            return message
+        
+        await self.app(scope, limited_receive, send)
+
+
+app.add_middleware(UploadLimitMiddleware)
+
+
+def upload_size(file: UploadFile) -> int:
+    """Size of a spooled upload in bytes, without reading it"""
+    if file.size is not None:
+        return file.size
+    position = file.file.tell()
+    size = file.file.seek(0, io.SEEK_END)
+    file.file.seek(position)
+    return size
+
+
+def check_upload_size(file: UploadFile, limit: int = MAX_UPLOAD_BYTES) -> int:
+    """Reject an upload larger than `limit` with 413 before decoding it"""
+    size = upload_size(file)
+    if size > limit:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File {file.filename} is {size} bytes (max {limit})"
+        )
+    return size
+
+
+async def read_body_limited(
+    request: Request,
+    limit: int,
+    tracker: MemoryTracker,
+    stop_after: Optional[int] = None
+) -> bytearray:
+    """
+    Read a raw request body in chunks, enforcing a size limit
+    
+    Args:
+        request: Incoming request
+        limit: Maximum body size; larger bodies get 413
+        tracker: Memory tracker for this request
+        stop_after: Stop reading once this many bytes have arrived
+        
+    Returns:
+        Body bytes (truncated to stop_after if given)
+    """
+    declared = request.headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit and stop_after is None:
+        raise HTTPException(status_code=413, detail=f"Request body is {declared} bytes (max {limit})")
+    
+    body = bytearray()
+    async for chunk in request.stream():
+        if stop_after is None and len(body) + len(chunk) > limit:
+            raise HTTPException(status_code=413, detail=f"Request body exceeds {limit} bytes")
+        body += chunk
+        tracker.hold(len(chunk))
+        if stop_after is not None and len(body) >= stop_after:
+            # Enough for the analysis window, leave the rest unread
+            break
+    
+    if stop_after is not None and len(body) > stop_after:
+        tracker.release(len(body) - stop_after)
+        del body[stop_after:]
+    return body
+
+
+def record_request_memory(endpoint: str, tracker: MemoryTracker):
+    """Add one request's peak buffered bytes to the metrics window"""
+    global request_count
+    
+    with request_memory_lock:
+        request_count += 1
+        request_memory_peaks.append(tracker.peak)
+    logger.info(f"{endpoint} peak buffered audio: {tracker.peak / 1024:.1f} KiB")
+
+
 def load_model():
-    """Load YAMNet and Keras classifier models"""
-    global keras_classifier, yamnet_model
+    """Load YAMNet and the active Keras classifier"""
+    global keras_classifier, yamnet_model, model_registry, active_model_version, active_model_path
     
     try:
         # Load YAMNet for feature extraction
@@ -94,10 +332,15 @@ def load_model():
         yamnet_model = hub.load(YAMNET_MODEL_URL)
         logger.info("✓ YAMNet model loaded successfully!")
         
-        # Load Keras classifier
-        logger.info(f"Loading Keras classifier from {KERAS_MODEL_PATH}...")
-        import tensorflow as tf
-        keras_classifier = tf.keras.models.load_model(KERAS_MODEL_PATH)
+        # Load the active registry version, or the default model if the registry is empty
+        model_registry = ModelRegistry(MODEL_REGISTRY_DIR)
+        version = model_registry.active_version()
+        path = model_registry.model_path(version) if version else KERAS_MODEL_PATH
+        
+        logger.info(f"Loading Keras classifier {version or DEFAULT_MODEL_VERSION} from {path}...")
+        keras_classifier = load_and_warm_model(path, EMBEDDING_DIM, list(THREAT_CLASSES.values()))
+        active_model_version = version or DEFAULT_MODEL_VERSION
+        active_model_path = path
         
         logger.info("✓ Keras classifier loaded successfully!")
         logger.info(f"Input shape: {keras_classifier.input_shape}")
@@ -111,78 +354,426 @@ def load_model():
         return False
 
 
-def preprocess_audio(audio_bytes: bytes) -> np.ndarray:
+def swap_active_model(model, version: str, path: str):
     """
-    Preprocess audio file and extract YAMNet embeddings
+    Atomically replace the serving classifier
+    
+    predict_threats takes its own reference to the model for each batch,
+    so in-flight batches finish on the old model and the next batch
+    uses the new one.
+    """
+    global keras_classifier, active_model_version, active_model_path, shadow_evaluator
+    
+    with model_swap_lock:
+        previous = active_model_version
+        keras_classifier = model
+        active_model_version = version
+        active_model_path = path
+        model_registry.set_active(version)
+        
+        # Shadowing the model that now serves traffic would only compare it with itself
+        if shadow_evaluator is not None and shadow_evaluator.version == version:
+            shadow_evaluator.stop()
+            shadow_evaluator = None
+    
+    logger.info(f"✓ Active model swapped: {previous} -> {version}")
+
+
+def start_shadow(model, version: str, fraction: float):
+    """Replace any running shadow evaluation with a new candidate"""
+    global shadow_evaluator
+    
+    with model_swap_lock:
+        if shadow_evaluator is not None:
+            shadow_evaluator.stop()
+        shadow_evaluator = ShadowEvaluator(model, version, fraction)
+    
+    logger.info(f"✓ Shadow evaluation started: {version} on {fraction:.0%} of batches")
+
+
+def load_model_version_async(version: str, target: str, fraction: float = 0.0):
+    """
+    Load and warm a registry version in a background thread
     
     Args:
-        audio_bytes: Raw audio file bytes
+        version: Registry version to load
+        target: "active" to swap it in, "shadow" to evaluate it
+        fraction: Share of live batches to shadow (shadow target only)
+    """
+    path = model_registry.model_path(version)
+    model_loads[version] = {
+        "target": target,
+        "status": "loading",
+        "started": datetime.datetime.now().isoformat()
+    }
+    
+    def run():
+        try:
+            # A model with other classes would mislabel or 500 on live traffic, so it is never swapped in
+            model = load_and_warm_model(path, EMBEDDING_DIM, list(THREAT_CLASSES.values()))
+            if target == "active":
+                swap_active_model(model, version, path)
+            else:
+                start_shadow(model, version, fraction)
+            model_loads[version]["status"] = "ready"
+        except Exception as e:
+            logger.error(f"Error loading model version {version}: {e}")
+            model_loads[version].update({"status": "failed", "error": str(e)})
+    
+    threading.Thread(target=run, name=f"model-load-{version}", daemon=True).start()
+
+
+def load_embedding_store():
+    """Open (or create) the on-disk store of past detection embeddings"""
+    global embedding_store
+    
+    try:
+        embedding_store = EmbeddingStore(EMBEDDING_STORE_DIR, dim=EMBEDDING_DIM)
+        return True
+    except Exception as e:
+        logger.error(f"Error opening embedding store: {e}")
+        return False
+
+
+def load_job_queue():
+    """Open the job store, requeue interrupted work and start the job workers"""
+    global job_store, job_workers
+    
+    try:
+        job_store = JobStore(JOB_DIR)
+        requeued = job_store.requeue_interrupted()
+        if requeued:
+            logger.info(f"Requeued {requeued} job files interrupted by the last shutdown")
+        job_workers = JobWorkerPool(job_store, process_job_batch, JOB_WORKERS, JOB_BATCH_SIZE)
+        job_workers.start()
+        logger.info(f"✓ Job queue started with {JOB_WORKERS} workers")
+        return True
+    except Exception as e:
+        logger.error(f"Error starting job queue: {e}")
+        return False
+
+
+def extract_embedding(audio_data: np.ndarray) -> np.ndarray:
+    """
+    Trim, normalize and embed a 16kHz mono waveform with YAMNet
+    
+    Args:
+        audio_data: Mono waveform at SAMPLE_RATE
         
     Returns:
         YAMNet embeddings (1024-dimensional vector) ready for classifier
     """
+    # Check if audio loaded successfully
+    if audio_data is None or len(audio_data) == 0:
+        raise ValueError("Failed to load audio or audio is empty")
+    
+    logger.info(f"Audio loaded: {len(audio_data)} samples at {SAMPLE_RATE} Hz ({len(audio_data)/SAMPLE_RATE:.2f} seconds)")
+    
+    # Limit to max duration
+    max_samples = SAMPLE_RATE * MAX_DURATION
+    if len(audio_data) > max_samples:
+        audio_data = audio_data[:max_samples]
+        logger.info(f"Audio trimmed to {MAX_DURATION} seconds")
+    
+    # Check if audio has content
+    if len(audio_data) < 160:  # Minimum ~10ms at 16kHz
+        raise ValueError(f"Audio too short: {len(audio_data)} samples ({len(audio_data)/SAMPLE_RATE*1000:.1f}ms)")
+    
+    # Normalize to [-1, 1] range (YAMNet requirement)
+    max_val = np.max(np.abs(audio_data))
+    if max_val > 0:
+        audio_data = audio_data / max_val
+    else:
+        logger.warning("Audio is silent (all zeros), using as-is")
+        # For silent audio, just use zeros - YAMNet can handle it
+    
+    # Convert to float32
+    audio_tensor = audio_data.astype(np.float32)
+    
+    logger.info(f"Audio prepared: shape {audio_tensor.shape}, range [{audio_tensor.min():.3f}, {audio_tensor.max():.3f}]")
+    
+    # Extract YAMNet embeddings
+    # YAMNet returns: (scores, embeddings, spectrogram)
+    logger.info("Extracting YAMNet embeddings...")
+    scores, embeddings, spectrogram = yamnet_model(audio_tensor)
+    
+    # Average embeddings across time (if multiple frames)
+    # Shape: (num_frames, 1024) -> (1024,)
+    embedding = np.mean(embeddings.numpy(), axis=0)
+    
+    # Reshape for model input: (1, 1024)
+    embedding = embedding.reshape(1, -1).astype(np.float32)
+    
+    logger.info(f"✓ YAMNet embedding extracted: {embedding.shape}")
+    return embedding
+
+
+def decode_upload(file: UploadFile, tracker: MemoryTracker, limit: int = MAX_UPLOAD_BYTES) -> np.ndarray:
+    """
+    Decode an upload incrementally, stopping once the analysis window is full
+    
+    The file is pulled through a BoundedReader in DECODE_BLOCK_FRAMES blocks,
+    so at most MAX_DURATION seconds of decoded samples (plus one block) are
+    ever held, whatever the upload size. Formats soundfile cannot open are
+    spooled to a temporary file and decoded by librosa with a duration cap.
+    
+    Args:
+        file: Uploaded audio file
+        tracker: Memory tracker for this request
+        limit: Maximum number of upload bytes to read
+        
+    Returns:
+        Mono waveform at SAMPLE_RATE, at most MAX_DURATION seconds long
+    """
+    file.file.seek(0)
+    reader = BoundedReader(file.file, limit)
+    
     try:
-        # Check if audio bytes are valid
-        if len(audio_bytes) == 0:
-            raise ValueError("Empty audio file received")
+        with sf.SoundFile(reader) as sound:
+            native_sr = sound.samplerate
+            window_frames = native_sr * MAX_DURATION
+            blocks = []
+            decoded = 0
+            while decoded < window_frames:
+                block = sound.read(min(DECODE_BLOCK_FRAMES, window_frames - decoded), dtype="float32", always_2d=True)
+                if len(block) == 0:
+                    break
+                tracker.hold(block.nbytes)
+                mono = block.mean(axis=1)
+                tracker.release(block.nbytes)
+                tracker.hold(mono.nbytes)
+                blocks.append(mono)
+                decoded += len(mono)
+        logger.info(f"Decoded {decoded} frames at {native_sr} Hz from {reader.bytes_read} upload bytes")
+    except sf.LibsndfileError:
+        logger.info("Format not supported by soundfile, decoding with librosa")
+        return decode_upload_fallback(file, tracker, limit)
+    
+    audio_data = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+    tracker.hold(audio_data.nbytes)
+    tracker.release(sum(b.nbytes for b in blocks))
+    
+    if native_sr != SAMPLE_RATE and len(audio_data) > 0:
+        resampled = librosa.resample(audio_data, orig_sr=native_sr, target_sr=SAMPLE_RATE)
+        tracker.hold(resampled.nbytes)
+        tracker.release(audio_data.nbytes)
+        audio_data = resampled
+    
+    return audio_data
+
+
+def decode_upload_fallback(file: UploadFile, tracker: MemoryTracker, limit: int) -> np.ndarray:
+    """Decode formats soundfile can't read (e.g. AAC) via a temporary file and librosa"""
+    file.file.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file.filename or "")[1]) as spool:
+        copied = 0
+        while True:
+            chunk = file.file.read(UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            copied += len(chunk)
+            if copied > limit:
+                raise ValueError(f"Upload exceeds {limit} bytes")
+            tracker.hold(len(chunk))
+            spool.write(chunk)
+            tracker.release(len(chunk))
+        spool.flush()
         
-        logger.info(f"Loading audio file ({len(audio_bytes)} bytes)...")
+        audio_data, sr = librosa.load(spool.name, sr=SAMPLE_RATE, mono=True, duration=MAX_DURATION)
+    
+    tracker.hold(audio_data.nbytes)
+    return audio_data
+
+
+def preprocess_upload(file: UploadFile, tracker: MemoryTracker, limit: int = MAX_UPLOAD_BYTES) -> np.ndarray:
+    """
+    Stream an uploaded audio file through the decoder and extract YAMNet embeddings
+    
+    Args:
+        file: Uploaded audio file
+        tracker: Memory tracker for this request
+        limit: Maximum number of upload bytes to read
         
-        # Load audio from bytes at 16kHz (YAMNet requirement)
-        audio_data, sr = librosa.load(io.BytesIO(audio_bytes), sr=SAMPLE_RATE, mono=True)
+    Returns:
+        YAMNet embeddings (1024-dimensional vector) ready for classifier
+    """
+    try:
+        if check_upload_size(file, limit) == 0:
+            raise ValueError("Empty audio file received")
         
-        # Check if audio loaded successfully
-        if audio_data is None or len(audio_data) == 0:
-            raise ValueError("Failed to load audio or audio is empty")
+        logger.info(f"Streaming audio file {file.filename} ({upload_size(file)} bytes)...")
+        audio_data = decode_upload(file, tracker, limit)
+        try:
+            return extract_embedding(audio_data)
+        finally:
+            # The samples are dropped once embedded, so a batch's peak is per file
+            tracker.release(audio_data.nbytes)
         
-        logger.info(f"Audio loaded: {len(audio_data)} samples at {sr} Hz ({len(audio_data)/sr:.2f} seconds)")
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.error(f"Audio validation error: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid audio file: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error preprocessing audio: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=400, detail=f"Error preprocessing audio: {str(e)}")
+
+
+def preprocess_pcm16(pcm_bytes: bytes) -> np.ndarray:
+    """
+    Extract YAMNet embeddings from raw PCM16 audio
+    
+    Skips container decoding and resampling entirely: the body must already
+    be 16kHz mono signed 16-bit little-endian samples.
+    
+    Args:
+        pcm_bytes: Raw PCM16 sample bytes
         
-        # Limit to max duration
-        max_samples = SAMPLE_RATE * MAX_DURATION
-        if len(audio_data) > max_samples:
-            audio_data = audio_data[:max_samples]
-            logger.info(f"Audio trimmed to {MAX_DURATION} seconds")
+    Returns:
+        YAMNet embeddings (1024-dimensional vector) ready for classifier
+    """
+    try:
+        if len(pcm_bytes) == 0:
+            raise ValueError("Empty PCM body received")
+        if len(pcm_bytes) % PCM16_BYTES_PER_SAMPLE != 0:
+            raise ValueError(f"PCM16 body length {len(pcm_bytes)} is not a multiple of {PCM16_BYTES_PER_SAMPLE} bytes")
         
-        # Check if audio has content
-        if len(audio_data) < 160:  # Minimum ~10ms at 16kHz
-            raise ValueError(f"Audio too short: {len(audio_data)} samples ({len(audio_data)/sr*1000:.1f}ms)")
+        # Only the analysis window is ever used, so don't convert the rest
+        max_bytes = SAMPLE_RATE * MAX_DURATION * PCM16_BYTES_PER_SAMPLE
+        samples = np.frombuffer(pcm_bytes[:max_bytes], dtype="<i2")
+        audio_data = samples.astype(np.float32) / 32768.0
         
-        # Normalize to [-1, 1] range (YAMNet requirement)
-        max_val = np.max(np.abs(audio_data))
-        if max_val > 0:
-            audio_data = audio_data / max_val
-        else:
-            logger.warning("Audio is silent (all zeros), using as-is")
-            # For silent audio, just use zeros - YAMNet can handle it
+        return extract_embedding(audio_data)
         
-        # Convert to float32
-        audio_tensor = audio_data.astype(np.float32)
+    except ValueError as e:
+        logger.error(f"PCM validation error: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid PCM16 audio: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error preprocessing PCM16 audio: {e}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=400, detail=f"Error preprocessing PCM16 audio: {str(e)}")
+
+
+def split_length_prefixed(body: bytes) -> List[bytes]:
+    """
+    Split a length-prefixed batch body into its records
+    
+    Each record is a little-endian uint32 byte count followed by that many
+    payload bytes.
+    
+    Args:
+        body: Raw request body
         
-        logger.info(f"Audio prepared: shape {audio_tensor.shape}, range [{audio_tensor.min():.3f}, {audio_tensor.max():.3f}]")
+    Returns:
+        List of record payloads
+    """
+    records = []
+    offset = 0
+    while offset < len(body):
+        if offset + BATCH_LENGTH_PREFIX_BYTES > len(body):
+            raise HTTPException(status_code=400, detail=f"Truncated length prefix at byte {offset}")
+        (length,) = struct.unpack_from("<I", body, offset)
+        offset += BATCH_LENGTH_PREFIX_BYTES
+        if offset + length > len(body):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Record {len(records)} declares {length} bytes but only {len(body) - offset} remain"
+            )
+        # Checked per record so a body of tiny records fails fast
+        if len(records) == MAX_BATCH_RECORDS:
+            raise HTTPException(status_code=413, detail=f"Too many records: more than {MAX_BATCH_RECORDS}")
+        records.append(body[offset:offset + length])
+        offset += length
+
+    return records
+
+
+def parse_float16_embeddings(body: bytes) -> np.ndarray:
+    """
+    Parse a body of packed float16 YAMNet embeddings
+    
+    Args:
+        body: Little-endian float16 values, EMBEDDING_DIM per embedding
         
-        # Extract YAMNet embeddings
-        # YAMNet returns: (scores, embeddings, spectrogram)
-        logger.info("Extracting YAMNet embeddings...")
-        scores, embeddings, spectrogram = yamnet_model(audio_tensor)
+    Returns:
+        Float32 array of shape (n, EMBEDDING_DIM) ready for classifier
+    """
+    row_bytes = EMBEDDING_DIM * FLOAT16_BYTES
+    if len(body) == 0:
+        raise HTTPException(status_code=400, detail="Empty embedding body received")
+    if len(body) % row_bytes != 0:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Embedding body length {len(body)} is not a multiple of {row_bytes} bytes ({EMBEDDING_DIM} x float16)"
+        )
+    
+    embeddings = np.frombuffer(body, dtype="<f2").reshape(-1, EMBEDDING_DIM)
+    if len(embeddings) > MAX_BATCH_RECORDS:
+        raise HTTPException(status_code=413, detail=f"Too many embeddings: {len(embeddings)} (max {MAX_BATCH_RECORDS})")
+    if not np.all(np.isfinite(embeddings)):
+        raise HTTPException(status_code=400, detail="Embeddings contain NaN or infinite values")
+    
+    return embeddings.astype(np.float32)
+
+
+def predict_threats(embeddings: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Run model inference on a batch of YAMNet embeddings
+    
+    Args:
+        embeddings: YAMNet embeddings, shape (n, 1024)
         
-        # Average embeddings across time (if multiple frames)
-        # Shape: (num_frames, 1024) -> (1024,)
-        embedding = np.mean(embeddings.numpy(), axis=0)
+    Returns:
+        List of prediction result dictionaries, one per row
+    """
+    try:
+        # One model per batch, even if a hot-swap lands mid-request
+        model = keras_classifier
         
-        # Reshape for model input: (1, 1024)
-        embedding = embedding.reshape(1, -1).astype(np.float32)
+        # Use Keras model for prediction (output is already softmax probabilities)
+        start = time.perf_counter()
+        batch_probabilities = model.predict(embeddings, verbose=0)
+        active_ms = (time.perf_counter() - start) * 1000
         
-        logger.info(f"✓ YAMNet embedding extracted: {embedding.shape}")
-        return embedding
+        results = []
+        for probabilities in batch_probabilities:
+            # Get predicted class
+            predicted_idx = int(np.argmax(probabilities))
+            predicted_class = THREAT_CLASSES[predicted_idx]
+            confidence = float(probabilities[predicted_idx])
+            
+            # Get all predictions
+            all_predictions = {
+                THREAT_CLASSES[i]: float(probabilities[i]) 
+                for i in range(len(THREAT_CLASSES))
+            }
+            
+            logger.info(f"Prediction: {predicted_class} ({confidence:.2%})")
+            logger.info(f"All predictions: {all_predictions}")
+            
+            results.append({
+                "predicted_class": predicted_class,
+                "confidence": confidence,
+                "all_predictions": all_predictions,
+                "priority": PRIORITY_MAP[predicted_class]
+            })
         
-    except ValueError as e:
-        logger.error(f"Audio validation error: {e}")
-        raise HTTPException(status_code=400, detail=f"Invalid audio file: {str(e)}")
     except Exception as e:
-        logger.error(f"Error preprocessing audio: {e}")
+        logger.error(f"Prediction error: {e}")
         import traceback
         traceback.print_exc()
-        raise HTTPException(status_code=400, detail=f"Error preprocessing audio: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+    
+    # Candidate model sees a sample of batches off the request path; submit()
+    # never raises, so shadow problems can't turn into a failed response
+    evaluator = shadow_evaluator
+    if evaluator is not None:
+        evaluator.submit(embeddings, batch_probabilities, active_ms)
+    
+    return results
 
 
 def predict_threat(embedding: np.ndarray) -> Dict[str, Any]:
@@ -195,36 +786,194 @@ def predict_threat(embedding: np.ndarray) -> Dict[str, Any]:
     Returns:
         Dictionary with prediction results
     """
-    try:
-        # Use Keras model for prediction (output is already softmax probabilities)
-        probabilities = keras_classifier.predict(embedding, verbose=0)[0]
-        
-        # Get predicted class
-        predicted_idx = np.argmax(probabilities)
-        predicted_class = THREAT_CLASSES[predicted_idx]
-        confidence = float(probabilities[predicted_idx])
+    return predict_threats(embedding.reshape(1, -1))[0]
+
+
+def next_detection_id() -> str:
+    """Return a unique, increasing millisecond-timestamp detection ID"""
+    global _last_detection_id
+    
+    with _detection_id_lock:
+        _last_detection_id = max(int(datetime.datetime.now().timestamp() * 1000), _last_detection_id + 1)
+        return str(_last_detection_id)
+
+
+def create_detection_response(
+    prediction: Dict[str, Any],
+    latitude: float,
+    longitude: float
+) -> DetectionResponse:
+    """
+    Build the detection response returned to the app
+    
+    Args:
+        prediction: Result dictionary from predict_threat
+        latitude: GPS latitude
+        longitude: GPS longitude
         
-        # Get all predictions
-        all_predictions = {
-            THREAT_CLASSES[i]: float(probabilities[i]) 
-            for i in range(len(THREAT_CLASSES))
-        }
+    Returns:
+        Detection response with prediction results
+    """
+    response = DetectionResponse(
+        id=next_detection_id(),
+        predicted_class=prediction["predicted_class"],
+        confidence=prediction["confidence"],
+        timestamp=datetime.datetime.now().isoformat(),
+        latitude=latitude,
+        longitude=longitude,
+        status="critical" if prediction["priority"] == "CRITICAL" else "pending",
+        priority=prediction["priority"],
+        all_predictions=prediction["all_predictions"]
+    )
+    
+    logger.info(f"Detection created: {response.id}")
+    return response
+
+
+def remember_embeddings(detections: List[DetectionResponse], embeddings: np.ndarray):
+    """
+    Persist detection embeddings for later similarity search
+    
+    Storage problems are logged, never surfaced to the caller: the
+    detection itself has already succeeded.
+    
+    Args:
+        detections: Detection responses, one per embedding row
+        embeddings: YAMNet embeddings, shape (n, 1024)
+    """
+    if embedding_store is None or not detections:
+        return
+    
+    try:
+        embedding_store.append([d.id for d in detections], embeddings)
+        if embedding_store.needs_reindex() and embedding_store.build_ivf_async():
+            logger.info("Rebuilding similarity index in the background")
+    except Exception as e:
+        logger.error(f"Error storing embeddings: {e}")
+
+
+def search_similar(
+    query: np.ndarray,
+    top_k: int,
+    exact: bool,
+    query_id: Optional[str] = None
+) -> SimilarityResponse:
+    """
+    Run a similarity search and time it
+    
+    Args:
+        query: Query embedding
+        top_k: Number of results
+        exact: Force an exact scan instead of the IVF index
+        query_id: Stored detection the query came from (excluded from results)
         
-        logger.info(f"Prediction: {predicted_class} ({confidence:.2%})")
-        logger.info(f"All predictions: {all_predictions}")
+    Returns:
+        Similarity response with timing
+    """
+    if not 1 <= top_k <= 100:
+        raise HTTPException(status_code=400, detail="top_k must be between 1 and 100")
+    
+    start = time.perf_counter()
+    matches, method = embedding_store.search(query, top_k=top_k, exact=exact, exclude_id=query_id)
+    query_ms = (time.perf_counter() - start) * 1000
+    
+    logger.info(f"Similarity search ({method}) over {len(embedding_store)} vectors: {query_ms:.1f}ms")
+    return SimilarityResponse(
+        query_id=query_id,
+        method=method,
+        query_ms=query_ms,
+        total_vectors=len(embedding_store),
+        results=[SimilarDetection(id=i, similarity=s) for i, s in matches]
+    )
+
+
+def spool_job_files(job_id: str, files: List[UploadFile]) -> List[Dict[str, str]]:
+    """
+    Copy a job's uploads into its spool directory
+    
+    Every limit is checked against the already-spooled uploads before
+    anything is copied, and files are copied in UPLOAD_CHUNK_BYTES chunks.
+    
+    Args:
+        job_id: Job the files belong to
+        files: Uploaded audio files
         
-        return {
-            "predicted_class": predicted_class,
-            "confidence": confidence,
-            "all_predictions": all_predictions,
-            "priority": PRIORITY_MAP[predicted_class]
-        }
+    Returns:
+        One {"filename", "spool_path"} dict per file, in upload order
+    """
+    if len(files) > MAX_JOB_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files: {len(files)} (max {MAX_JOB_FILES})")
+    total_bytes = sum(check_upload_size(file) for file in files)
+    if total_bytes > MAX_JOB_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Job is {total_bytes} bytes (max {MAX_JOB_UPLOAD_BYTES})"
+        )
+    
+    directory = job_store.spool_dir(job_id)
+    os.makedirs(directory, exist_ok=True)
+    spooled = []
+    try:
+        for index, file in enumerate(files):
+            path = os.path.join(directory, f"{index:05d}")
+            file.file.seek(0)
+            with open(path, "wb") as out:
+                shutil.copyfileobj(file.file, out, UPLOAD_CHUNK_BYTES)
+            spooled.append({"filename": file.filename, "spool_path": path})
+    except Exception:
+        job_store.remove_spool(job_id)
+        raise
+    return spooled
+
+
+def process_job_batch(job: Dict[str, Any], files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Decode a batch of spooled job files and classify them together
+    
+    Files that fail to decode get an error result; the rest share one
+    classifier call.
+    
+    Args:
+        job: Job row from the job store
+        files: File rows claimed from that job
         
-    except Exception as e:
-        logger.error(f"Prediction error: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
+    Returns:
+        One result dict per file for JobStore.record_results
+    """
+    results = []
+    decoded = []
+    embeddings = []
+    
+    for file in files:
+        try:
+            with open(file["spool_path"], "rb") as handle:
+                upload = UploadFile(handle, size=os.path.getsize(file["spool_path"]), filename=file["filename"])
+                embeddings.append(preprocess_upload(upload, MemoryTracker()))
+            decoded.append(file)
+        except Exception as e:
+            error = e.detail if isinstance(e, HTTPException) else (str(e) or type(e).__name__)
+            logger.error(f"Job {job['id']}: error processing {file['filename']}: {error}")
+            results.append({"file_index": file["file_index"], "error": error})
+    
+    if decoded:
+        batch = np.vstack(embeddings)
+        predictions = predict_threats(batch)
+        detections = [
+            create_detection_response(prediction, job["latitude"], job["longitude"])
+            for prediction in predictions
+        ]
+        remember_embeddings(detections, batch)
+        for file, detection in zip(decoded, detections):
+            results.append({
+                "file_index": file["file_index"],
+                "detection_id": detection.id,
+                "predicted_class": detection.predicted_class,
+                "confidence": detection.confidence,
+                "priority": detection.priority,
+                "all_predictions": detection.all_predictions
+            })
+    
+    return results
 
 
 @app.on_event("startup")
@@ -233,6 +982,18 @@ async def startup_event():
     success = load_model()
     if not success:
         logger.error("Failed to load model on startup!")
+    if not load_embedding_store():
+        logger.error("Failed to open embedding store on startup!")
+    # Workers only start once there is a model to run queued files through
+    if success and not load_job_queue():
+        logger.error("Failed to start job queue on startup!")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Let job workers finish their current batch, up to JOB_SHUTDOWN_SECONDS, and stop"""
+    if job_workers is not None and not job_workers.stop(JOB_SHUTDOWN_SECONDS):
+        logger.warning("Job workers still busy at shutdown; their files will be requeued on the next start")
 
 
 @app.get("/", response_model=HealthResponse)
@@ -284,31 +1045,18 @@ async def predict_audio(
             detail=f"Invalid file type: {file.content_type}. Expected audio file."
         )
     
+    tracker = MemoryTracker()
     try:
-        # Read audio file
+        # Stream audio file through the decoder
         logger.info(f"Processing file: {file.filename}")
-        audio_bytes = await file.read()
-        
-        # Preprocess audio
-        audio_data = preprocess_audio(audio_bytes)
+        audio_data = preprocess_upload(file, tracker)
         
         # Run prediction
         prediction = predict_threat(audio_data)
         
         # Create response
-        response = DetectionResponse(
-            id=str(int(datetime.datetime.now().timestamp() * 1000)),
-            predicted_class=prediction["predicted_class"],
-            confidence=prediction["confidence"],
-            timestamp=datetime.datetime.now().isoformat(),
-            latitude=latitude,
-            longitude=longitude,
-            status="critical" if prediction["priority"] == "CRITICAL" else "pending",
-            priority=prediction["priority"],
-            all_predictions=prediction["all_predictions"]
-        )
-        
-        logger.info(f"Detection created: {response.id}")
+        response = create_detection_response(prediction, latitude, longitude)
+        remember_embeddings([response], audio_data)
         return response
         
     except HTTPException:
@@ -316,6 +1064,8 @@ async def predict_audio(
     except Exception as e:
         logger.error(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        record_request_memory("/predict", tracker)
 
 
 @app.post("/batch-predict")
@@ -332,13 +1082,21 @@ async def batch_predict(files: list[UploadFile] = File(...)):
     if keras_classifier is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    # Uploads are already spooled, so the batch limit can be checked before decoding anything
+    total_bytes = sum(upload_size(file) for file in files)
+    if total_bytes > MAX_BATCH_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch is {total_bytes} bytes (max {MAX_BATCH_UPLOAD_BYTES})"
+        )
+    
     results = []
+    tracker = MemoryTracker()
     
     for file in files:
         try:
-            # Read and process each file
-            audio_bytes = await file.read()
-            audio_data = preprocess_audio(audio_bytes)
+            # Stream and process each file
+            audio_data = preprocess_upload(file, tracker)
             prediction = predict_threat(audio_data)
             
             results.append({
@@ -352,12 +1110,264 @@ async def batch_predict(files: list[UploadFile] = File(...)):
             logger.error(f"Error processing {file.filename}: {e}")
             results.append({
                 "filename": file.filename,
-                "error": str(e)
+                "error": e.detail if isinstance(e, HTTPException) else str(e)
             })
     
+    record_request_memory("/batch-predict", tracker)
     return {"results": results, "total": len(files)}
 
 
+@app.post("/predict-pcm", response_model=DetectionResponse)
+async def predict_pcm(
+    request: Request,
+    latitude: Optional[float] = -1.2921,
+    longitude: Optional[float] = 36.8219
+):
+    """
+    Predict threat from raw PCM16 audio
+    
+    The request body is 16kHz mono signed 16-bit little-endian samples
+    with no container, so no decoding or resampling happens server-side.
+    
+    Args:
+        request: Request whose body holds the PCM16 samples
+        latitude: GPS latitude (optional)
+        longitude: GPS longitude (optional)
+        
+    Returns:
+        Detection response with prediction results
+    """
+    if keras_classifier is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    tracker = MemoryTracker()
+    pcm_bytes = await read_body_limited(request, MAX_UPLOAD_BYTES, tracker)
+    logger.info(f"Processing PCM16 body ({len(pcm_bytes)} bytes)")
+    
+    embedding = preprocess_pcm16(pcm_bytes)
+    prediction = predict_threat(embedding)
+    response = create_detection_response(prediction, latitude, longitude)
+    remember_embeddings([response], embedding)
+    record_request_memory("/predict-pcm", tracker)
+    return response
+
+
+@app.post("/predict-stream", response_model=DetectionResponse)
+async def predict_stream(
+    request: Request,
+    latitude: Optional[float] = -1.2921,
+    longitude: Optional[float] = 36.8219
+):
+    """
+    Predict threat from a streamed raw PCM16 body
+    
+    Same format as /predict-pcm, but the body is consumed chunk by chunk
+    and reading stops as soon as MAX_DURATION seconds of samples have
+    arrived, so a long or endless stream never sits in memory.
+    
+    Args:
+        request: Request streaming 16kHz mono PCM16 samples
+        latitude: GPS latitude (optional)
+        longitude: GPS longitude (optional)
+        
+    Returns:
+        Detection response with prediction results
+    """
+    if keras_classifier is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    tracker = MemoryTracker()
+    window_bytes = SAMPLE_RATE * MAX_DURATION * PCM16_BYTES_PER_SAMPLE
+    pcm_bytes = await read_body_limited(request, MAX_UPLOAD_BYTES, tracker, stop_after=window_bytes)
+    logger.info(f"Processing streamed PCM16 window ({len(pcm_bytes)} bytes)")
+    
+    embedding = preprocess_pcm16(pcm_bytes)
+    prediction = predict_threat(embedding)
+    response = create_detection_response(prediction, latitude, longitude)
+    remember_embeddings([response], embedding)
+    record_request_memory("/predict-stream", tracker)
+    return response
+
+
+@app.post("/batch-predict-pcm")
+async def batch_predict_pcm(
+    request: Request,
+    latitude: Optional[float] = -1.2921,
+    longitude: Optional[float] = 36.8219
+):
+    """
+    Predict threats from a length-prefixed batch of raw PCM16 clips
+    
+    Each record is a little-endian uint32 byte count followed by that many
+    bytes of 16kHz mono PCM16. All clips are classified in a single batch.
+    
+    Args:
+        request: Request whose body holds the length-prefixed records
+        latitude: GPS latitude (optional)
+        longitude: GPS longitude (optional)
+        
+    Returns:
+        Detection responses (or errors) in record order
+    """
+    if keras_classifier is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    tracker = MemoryTracker()
+    records = split_length_prefixed(await read_body_limited(request, MAX_BATCH_UPLOAD_BYTES, tracker))
+    results: List[Any] = [None] * len(records)
+    
+    # Embed each clip, then classify all good clips together
+    embedded_indices = []
+    embeddings = []
+    for index, record in enumerate(records):
+        try:
+            embeddings.append(preprocess_pcm16(record))
+            embedded_indices.append(index)
+        except HTTPException as e:
+            logger.error(f"Error processing record {index}: {e.detail}")
+            results[index] = {"index": index, "error": e.detail}
+    
+    if embeddings:
+        embeddings = np.vstack(embeddings)
+        predictions = predict_threats(embeddings)
+        for index, prediction in zip(embedded_indices, predictions):
+            results[index] = create_detection_response(prediction, latitude, longitude)
+        remember_embeddings([results[index] for index in embedded_indices], embeddings)
+    
+    record_request_memory("/batch-predict-pcm", tracker)
+    return {"results": results, "total": len(records)}
+
+
+@app.post("/predict-embeddings")
+async def predict_embeddings(
+    request: Request,
+    latitude: Optional[float] = -1.2921,
+    longitude: Optional[float] = 36.8219
+):
+    """
+    Predict threats from YAMNet embeddings computed on-device
+    
+    The request body is one or more 1024-dim embeddings packed as
+    little-endian float16, row after row. YAMNet is skipped entirely.
+    
+    Args:
+        request: Request whose body holds the packed embeddings
+        latitude: GPS latitude (optional)
+        longitude: GPS longitude (optional)
+        
+    Returns:
+        Detection responses in embedding order
+    """
+    if keras_classifier is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    tracker = MemoryTracker()
+    embeddings = parse_float16_embeddings(await read_body_limited(request, MAX_BATCH_UPLOAD_BYTES, tracker))
+    record_request_memory("/predict-embeddings", tracker)
+    logger.info(f"Processing {len(embeddings)} precomputed embedding(s)")
+    
+    predictions = predict_threats(embeddings)
+    results = [
+        create_detection_response(prediction, latitude, longitude)
+        for prediction in predictions
+    ]
+    remember_embeddings(results, embeddings)
+    return {"results": results, "total": len(results)}
+
+
+# Similarity endpoints are plain functions so FastAPI runs them in its
+# threadpool: decoding and an exact scan are long blocking numpy work
+@app.post("/similar", response_model=SimilarityResponse)
+def similar_to_audio(
+    file: UploadFile = File(...),
+    top_k: int = 10,
+    exact: bool = False
+):
+    """
+    Find past detections that sound like an audio file
+    
+    Args:
+        file: Audio file (WAV, MP3, etc.)
+        top_k: Number of results (1-100)
+        exact: Scan every stored vector instead of using the IVF index
+        
+    Returns:
+        Most similar past detections by cosine similarity of YAMNet embeddings
+    """
+    if yamnet_model is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if embedding_store is None:
+        raise HTTPException(status_code=503, detail="Embedding store not available")
+    
+    tracker = MemoryTracker()
+    embedding = preprocess_upload(file, tracker)
+    record_request_memory("/similar", tracker)
+    return search_similar(embedding, top_k, exact)
+
+
+@app.get("/similar/{detection_id}", response_model=SimilarityResponse)
+def similar_to_detection(detection_id: str, top_k: int = 10, exact: bool = False):
+    """
+    Find past detections that sound like a stored detection
+    
+    Args:
+        detection_id: ID of a previous detection
+        top_k: Number of results (1-100)
+        exact: Scan every stored vector instead of using the IVF index
+        
+    Returns:
+        Most similar past detections, excluding the query itself
+    """
+    if embedding_store is None:
+        raise HTTPException(status_code=503, detail="Embedding store not available")
+    if detection_id not in embedding_store:
+        raise HTTPException(status_code=404, detail=f"Unknown detection: {detection_id}")
+    
+    return search_similar(embedding_store.vector(detection_id), top_k, exact, query_id=detection_id)
+
+
+@app.post("/similar/reindex", status_code=202)
+async def reindex_similar():
+    """Rebuild the IVF similarity index in the background"""
+    if embedding_store is None:
+        raise HTTPException(status_code=503, detail="Embedding store not available")
+    
+    started = embedding_store.build_ivf_async()
+    return {
+        "status": "started" if started else "already_running",
+        "total_vectors": len(embedding_store)
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Per-request memory metrics for the upload and decode paths"""
+    with request_memory_lock:
+        peaks = np.array(request_memory_peaks, dtype=np.float64)
+        total_requests = request_count
+    
+    def percentile(q):
+        return float(np.percentile(peaks, q)) if len(peaks) else 0.0
+    
+    return {
+        "requests": total_requests,
+        "request_peak_bytes": {
+            "window": len(peaks),
+            "last": float(peaks[-1]) if len(peaks) else 0.0,
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "max": float(peaks.max()) if len(peaks) else 0.0
+        },
+        "limits": {
+            "max_upload_bytes": MAX_UPLOAD_BYTES,
+            "max_batch_upload_bytes": MAX_BATCH_UPLOAD_BYTES
+        },
+        "process_peak_rss_mb": process_peak_rss_mb(),
+        "jobs": job_store.counts() if job_store is not None else {},
+        "timestamp": datetime.datetime.now().isoformat()
+    }
+
+
 @app.get("/classes")
 async def get_classes():
     """Get available threat classes"""
@@ -373,8 +1383,13 @@ async def get_model_info():
     if keras_classifier is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
+    # The shadow can be replaced or removed by another thread at any time
+    evaluator = shadow_evaluator
     return {
-        "model_path": KERAS_MODEL_PATH,
+        "model_path": active_model_path,
+        "active_version": active_model_version,
+        "shadow_version": evaluator.version if evaluator is not None else None,
+        "shadow": evaluator.stats() if evaluator is not None else None,
         "model_type": "Keras Sequential",
         "input_shape": str(keras_classifier.input_shape),
         "output_shape": str(keras_classifier.output_shape),
@@ -387,6 +1402,185 @@ async def get_model_info():
     }
 
 
+
+@app.get("/models")
+async def list_models():
+    """List registry versions with the active, shadow and loading ones"""
+    if model_registry is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    
+    evaluator = shadow_evaluator
+    return {
+        "registry": MODEL_REGISTRY_DIR,
+        "versions": [
+            {"version": v, "metadata": model_registry.metadata(v)}
+            for v in model_registry.versions()
+        ],
+        "active_version": active_model_version,
+        "shadow_version": evaluator.version if evaluator is not None else None,
+        "loads": model_loads
+    }
+
+
+def check_loadable_version(version: str):
+    """Reject unknown versions and versions that are already loading"""
+    if model_registry is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if not model_registry.has_version(version):
+        raise HTTPException(status_code=404, detail=f"Unknown model version: {version}")
+    if model_loads.get(version, {}).get("status") == "loading":
+        raise HTTPException(status_code=409, detail=f"Model version {version} is already loading")
+
+
+@app.post("/models/{version}/activate", status_code=202)
+async def activate_model(version: str):
+    """
+    Hot-swap the serving model to a registry version
+    
+    The version is loaded and warmed in the background while the current
+    model keeps serving; poll /models or /model-info to see the swap.
+    """
+    check_loadable_version(version)
+    load_model_version_async(version, "active")
+    return {"status": "loading", "version": version, "target": "active"}
+
+
+@app.post("/models/{version}/shadow", status_code=202)
+async def shadow_model(version: str, fraction: float = 0.1):
+    """
+    Evaluate a registry version on a sample of live traffic
+    
+    Responses always come from the active model; the candidate's
+    agreement rate and latency are reported in /model-info.
+    
+    Args:
+        version: Candidate registry version
+        fraction: Share of live batches to evaluate (0-1]
+    """
+    if not 0 < fraction <= 1:
+        raise HTTPException(status_code=400, detail="fraction must be in (0, 1]")
+    check_loadable_version(version)
+    if version == active_model_version:
+        raise HTTPException(status_code=400, detail=f"Model version {version} is already active")
+    
+    load_model_version_async(version, "shadow", fraction)
+    return {"status": "loading", "version": version, "target": "shadow", "fraction": fraction}
+
+
+@app.delete("/models/shadow")
+async def stop_shadow():
+    """Stop shadow evaluation and return its final statistics"""
+    global shadow_evaluator
+    
+    with model_swap_lock:
+        evaluator = shadow_evaluator
+        shadow_evaluator = None
+    if evaluator is None:
+        raise HTTPException(status_code=404, detail="No shadow evaluation running")
+    
+    evaluator.stop()
+    return {"status": "stopped", "shadow": evaluator.stats()}
+
+
+# A plain function so FastAPI runs it in its threadpool: spooling can copy
+# gigabytes, which must not block the event loop
+@app.post("/jobs", status_code=202)
+def submit_job(
+    files: list[UploadFile] = File(...),
+    latitude: Optional[float] = -1.2921,
+    longitude: Optional[float] = 36.8219
+):
+    """
+    Queue a large batch of audio files for background processing
+    
+    The uploads are spooled to disk and the job ID is returned at once;
+    poll GET /jobs/{job_id} for progress and page through
+    GET /jobs/{job_id}/results.
+    
+    Args:
+        files: Audio files (WAV, MP3, etc.)
+        latitude: GPS latitude applied to every detection (optional)
+        longitude: GPS longitude applied to every detection (optional)
+    """
+    if keras_classifier is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    if job_store is None:
+        raise HTTPException(status_code=503, detail="Job queue not available")
+    
+    job_id = uuid.uuid4().hex
+    spooled = spool_job_files(job_id, files)
+    try:
+        job_store.create_job(job_id, spooled, latitude, longitude)
+    except Exception:
+        # Without a job row nothing would ever clean up the spooled files
+        job_store.remove_spool(job_id)
+        raise
+    job_workers.notify()
+    
+    logger.info(f"Job {job_id} queued with {len(spooled)} files")
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "total_files": len(spooled),
+        "status_url": f"/jobs/{job_id}",
+        "results_url": f"/jobs/{job_id}/results"
+    }
+
+
+def get_job_or_404(job_id: str) -> Dict[str, Any]:
+    if job_store is None:
+        raise HTTPException(status_code=503, detail="Job queue not available")
+    job = job_store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and per-file progress of a job"""
+    job = get_job_or_404(job_id)
+    finished = job["files"]["done"] + job["files"]["error"]
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "total_files": job["total_files"],
+        "files": job["files"],
+        "progress": finished / job["total_files"] if job["total_files"] else 1.0
+    }
+
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str, offset: int = 0, limit: int = 100):
+    """
+    Page through a job's per-file results in upload order
+    
+    Files that are still queued or processing are included with their
+    status and no prediction, so pages are stable while a job runs.
+    """
+    if offset < 0 or not 1 <= limit <= JOB_RESULTS_MAX_PAGE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"offset must be >= 0 and limit between 1 and {JOB_RESULTS_MAX_PAGE}"
+        )
+    
+    job = get_job_or_404(job_id)
+    results = job_store.results(job_id, offset, limit)
+    next_offset = offset + len(results)
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "total_files": job["total_files"],
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset if next_offset < job["total_files"] else None,
+        "results": results
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000, log_level="info")
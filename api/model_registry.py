@@ -0,0 +1,286 @@
+"""
+Versioned classifier registry and shadow evaluation
+
+Models are deployed by dropping a new version directory into the
+registry; the API loads and warms it in the background and swaps it in
+without a restart.
+
+On-disk layout (one directory):
+    <version>/model.keras         Keras classifier for that version
+    <version>/normalization.json  Input mean/std the model was trained with (optional)
+    <version>/metadata.json       Notes about the version (optional); its class_names,
+                                  if present, must match the API's classes in order
+    ACTIVE                        Name of the version to serve on startup
+"""
+
+import datetime
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.keras"
+METADATA_FILE = "metadata.json"
+NORMALIZATION_FILE = "normalization.json"
+ACTIVE_FILE = "ACTIVE"
+
+WARMUP_BATCH_SIZES = (1, 32)  # batch shapes run once before a model takes traffic
+SHADOW_MAX_PENDING = 8  # sampled batches allowed to queue before shadow samples are dropped
+LATENCY_WINDOW = 1000
+
+
+class NormalizedModel:
+    """
+    Classifier that standardizes embeddings before predicting
+
+    Wraps models exported by the training runner, which were trained on
+    (x - mean) / std embeddings. Everything except predict() is passed
+    through to the wrapped model.
+    """
+
+    def __init__(self, model, mean: float, std: float):
+        self.model = model
+        self.mean = mean
+        self.std = std
+
+    def predict(self, x, **kwargs):
+        return self.model.predict((np.asarray(x, dtype=np.float32) - self.mean) / self.std, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+
+def check_model_classes(model, path: str, class_names: List[str]):
+    """
+    Reject a classifier whose outputs don't line up with the API's classes
+
+    Output index i is reported as class_names[i], so the model must have
+    exactly that many outputs, and a metadata.json next to the model that
+    lists class_names must list the same ones in the same order.
+
+    Args:
+        model: Loaded Keras model
+        path: Path the model was loaded from
+        class_names: Class name for each output index
+
+    Raises:
+        ValueError: If the model's classes differ from class_names
+    """
+    outputs = model.output_shape[-1]
+    if outputs != len(class_names):
+        raise ValueError(f"Model has {outputs} outputs but the API serves {len(class_names)} classes")
+    metadata_path = os.path.join(os.path.dirname(path), METADATA_FILE)
+    if os.path.exists(metadata_path):
+        with open(metadata_path, "r") as f:
+            model_classes = json.load(f).get("class_names")
+        if model_classes is not None and list(model_classes) != list(class_names):
+            raise ValueError(f"Model classes {model_classes} do not match the API's classes {list(class_names)}")
+
+
+def load_and_warm_model(path: str, input_dim: int = 1024, class_names: Optional[List[str]] = None):
+    """
+    Load a Keras classifier and run it once per warm-up batch size
+
+    The first predict() call traces and compiles the model; doing it here
+    keeps that cost off the first live request after a swap. If a
+    normalization.json sits next to the model, its statistics are
+    applied to every input.
+
+    Args:
+        path: Path to a .keras model file
+        input_dim: Embedding dimension the model expects
+        class_names: If given, the model is checked against these classes
+            (see check_model_classes) before it is warmed
+
+    Returns:
+        The loaded, warmed model
+    """
+    import tensorflow as tf
+
+    start = time.perf_counter()
+    model = tf.keras.models.load_model(path)
+    if class_names is not None:
+        check_model_classes(model, path, class_names)
+    normalization_path = os.path.join(os.path.dirname(path), NORMALIZATION_FILE)
+    if os.path.exists(normalization_path):
+        with open(normalization_path, "r") as f:
+            stats = json.load(f)
+        model = NormalizedModel(model, float(stats["mean"]), float(stats["std"]))
+        logger.info(f"Applying input normalization: mean {model.mean:.4f}, std {model.std:.4f}")
+    for batch_size in WARMUP_BATCH_SIZES:
+        model.predict(np.zeros((batch_size, input_dim), dtype=np.float32), verbose=0)
+    logger.info(f"✓ Model loaded and warmed from {path} in {time.perf_counter() - start:.1f}s")
+    return model
+
+
+class ModelRegistry:
+    """
+    Directory of versioned classifier models
+
+    Args:
+        directory: Registry root (created if missing)
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def versions(self) -> List[str]:
+        """Versions with a model file, oldest first by modification time"""
+        found = []
+        for name in os.listdir(self.directory):
+            path = self.model_path(name)
+            if os.path.isfile(path):
+                found.append((os.path.getmtime(path), name))
+        return [name for _, name in sorted(found)]
+
+    def model_path(self, version: str) -> str:
+        return os.path.join(self.directory, version, MODEL_FILE)
+
+    def has_version(self, version: str) -> bool:
+        # Version names become path components, so refuse anything that could escape the registry
+        if not version or version != os.path.basename(version) or version.startswith("."):
+            return False
+        return os.path.isfile(self.model_path(version))
+
+    def metadata(self, version: str) -> Dict[str, Any]:
+        path = os.path.join(self.directory, version, METADATA_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def active_version(self) -> Optional[str]:
+        """Version recorded as active, falling back to the newest one"""
+        path = os.path.join(self.directory, ACTIVE_FILE)
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                version = f.read().strip()
+            if self.has_version(version):
+                return version
+            logger.warning(f"Active model version {version!r} not found in registry")
+        versions = self.versions()
+        return versions[-1] if versions else None
+
+    def set_active(self, version: str):
+        """Record the version to serve after a restart"""
+        tmp_path = os.path.join(self.directory, f".{ACTIVE_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(version + "\n")
+        os.replace(tmp_path, os.path.join(self.directory, ACTIVE_FILE))
+
+
+class ShadowEvaluator:
+    """
+    Run a candidate model on a sample of live batches and compare it to the active one
+
+    Sampled batches are handed to a single background thread, so the
+    candidate never adds latency to, or changes, a live response.
+
+    Args:
+        model: Candidate classifier
+        version: Candidate version name
+        fraction: Share of live batches to evaluate (0-1)
+    """
+
+    def __init__(self, model, version: str, fraction: float):
+        self.model = model
+        self.version = version
+        self.fraction = fraction
+        self.started = datetime.datetime.now().isoformat()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stopped = False
+        self.sampled = 0
+        self.skipped = 0
+        self.errors = 0
+        self.compared = 0
+        self.agreements = 0
+        self._active_ms = deque(maxlen=LATENCY_WINDOW)
+        self._shadow_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def submit(self, embeddings: np.ndarray, active_probabilities: np.ndarray, active_ms: float):
+        """
+        Maybe queue one live batch for shadow evaluation
+
+        Never raises: a request may still hold this evaluator after it has
+        been stopped, and shadow problems must not reach live responses.
+
+        Args:
+            embeddings: Classifier input for the batch
+            active_probabilities: Active model output for the batch
+            active_ms: Active model latency for the batch
+        """
+        if random.random() >= self.fraction:
+            return
+        try:
+            with self._lock:
+                if self._stopped:
+                    return
+                if self._pending >= SHADOW_MAX_PENDING:
+                    self.skipped += 1
+                    return
+                # Submitted under the lock so stop() cannot shut the executor down in between
+                self._executor.submit(self._evaluate, np.array(embeddings), np.array(active_probabilities), active_ms)
+                self._pending += 1
+                self.sampled += 1
+        except Exception as e:
+            logger.error(f"Shadow submit error ({self.version}): {e}")
+            with self._lock:
+                self.errors += 1
+
+    def _evaluate(self, embeddings: np.ndarray, active_probabilities: np.ndarray, active_ms: float):
+        try:
+            start = time.perf_counter()
+            shadow_probabilities = self.model.predict(embeddings, verbose=0)
+            shadow_ms = (time.perf_counter() - start) * 1000
+            agree = int(np.sum(np.argmax(shadow_probabilities, axis=1) == np.argmax(active_probabilities, axis=1)))
+            with self._lock:
+                self.compared += len(embeddings)
+                self.agreements += agree
+                self._active_ms.append(active_ms)
+                self._shadow_ms.append(shadow_ms)
+        except Exception as e:
+            logger.error(f"Shadow evaluation error ({self.version}): {e}")
+            with self._lock:
+                self.errors += 1
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Agreement rate and latency of the candidate against the active model"""
+        def summary(values):
+            if not values:
+                return {"mean_ms": None, "p95_ms": None}
+            values = np.array(values)
+            return {"mean_ms": float(values.mean()), "p95_ms": float(np.percentile(values, 95))}
+
+        with self._lock:
+            return {
+                "version": self.version,
+                "fraction": self.fraction,
+                "started": self.started,
+                "sampled_batches": self.sampled,
+                "skipped_batches": self.skipped,
+                "errors": self.errors,
+                "compared_predictions": self.compared,
+                "agreement_rate": self.agreements / self.compared if self.compared else None,
+                "active_latency": summary(self._active_ms),
+                "shadow_latency": summary(self._shadow_ms)
+            }
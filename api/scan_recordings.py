@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+Offline bulk scanner for field-recorder dumps
+
+Walks a directory tree of recordings, decodes them in blocks in a
+process pool, runs YAMNet and the classifier over sliding windows and
+writes detections incrementally to CSV or Parquet. Progress is
+checkpointed, so an interrupted scan picks up where it stopped.
+
+Usage:
+    python scan_recordings.py /data/sd_dump --output detections.csv
+    python scan_recordings.py /data/sd_dump --output detections.parquet --workers 4 --hop 1.0
+
+Each window is MAX_DURATION seconds long and, by default, is
+peak-normalized and embedded on its own exactly as /predict does.
+--fast-windows runs YAMNet once per block instead and averages the
+frames inside each window. It is about twice as fast at the default hop,
+but normalizes per block, so a loud event lowers the level of every other
+window in its block and scores can differ from /predict.
+
+A block that fails to decode is logged, recorded under its file in the
+checkpoint, and skipped; the rest of the scan carries on.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger("scan_recordings")
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".ogg", ".m4a", ".aac", ".aif", ".aiff")
+CHECKPOINT_VERSION = 1
+OUTPUT_COLUMNS = ["file", "offset_seconds", "duration_seconds", "predicted_class", "confidence", "priority"]
+
+# YAMNet framing: 0.96s frames every 0.48s
+YAMNET_FRAME_SECONDS = 0.96
+YAMNET_HOP_SECONDS = 0.48
+MIN_WINDOW_SECONDS = YAMNET_FRAME_SECONDS  # shorter tails at the end of a file are skipped
+
+
+def find_recordings(root: str) -> List[str]:
+    """Audio files under root, relative to it, in a stable order"""
+    found = []
+    for directory, subdirs, files in os.walk(root):
+        subdirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(AUDIO_EXTENSIONS) and not name.startswith("."):
+                found.append(os.path.relpath(os.path.join(directory, name), root))
+    return found
+
+
+def audio_duration(path: str) -> float:
+    """Duration of a recording in seconds, without decoding it"""
+    import soundfile as sf
+
+    try:
+        return sf.info(path).duration
+    except Exception:
+        import librosa
+        return librosa.get_duration(path=path)
+
+
+def decode_block(path: str, start: float, duration: float, sample_rate: int) -> np.ndarray:
+    """
+    Decode one block of a recording to mono float32 at sample_rate (runs in a worker)
+
+    Args:
+        path: Recording path
+        start: Block start in seconds
+        duration: Block length in seconds
+        sample_rate: Target sample rate
+
+    Returns:
+        Mono waveform for [start, start + duration), shorter at end of file
+    """
+    import librosa
+    import soundfile as sf
+
+    try:
+        with sf.SoundFile(path) as sound:
+            native_sr = sound.samplerate
+            sound.seek(int(start * native_sr))
+            block = sound.read(int(duration * native_sr), dtype="float32", always_2d=True).mean(axis=1)
+        if native_sr != sample_rate and len(block) > 0:
+            block = librosa.resample(block, orig_sr=native_sr, target_sr=sample_rate)
+        return block.astype(np.float32)
+    except sf.LibsndfileError:
+        # Compressed formats soundfile can't seek in (e.g. AAC) go through librosa/audioread
+        block, _ = librosa.load(path, sr=sample_rate, mono=True, offset=start, duration=duration)
+        return block.astype(np.float32)
+
+
+def _decode_task(task: Tuple[str, str, int, float, float, int]):
+    """Decode one block, returning the error instead of raising so one bad file can't stop the scan"""
+    relpath, path, block_index, start, duration, sample_rate = task
+    try:
+        return relpath, block_index, start, decode_block(path, start, duration, sample_rate), None
+    except Exception as e:
+        return relpath, block_index, start, None, f"{type(e).__name__}: {e}"
+
+
+def window_starts(block_start: float, block_seconds: float, available: float, window: float, hop: float) -> List[float]:
+    """
+    Start times of the windows owned by a block
+
+    A block owns every window starting in [block_start, block_start +
+    block_seconds); blocks are decoded with `window` seconds of overlap so
+    those windows are complete.
+    """
+    starts = []
+    offset = 0.0
+    while offset < block_seconds and min(window, available - offset) >= MIN_WINDOW_SECONDS:
+        starts.append(block_start + offset)
+        offset += hop
+    return starts
+
+
+def normalize_peak(audio: np.ndarray) -> np.ndarray:
+    max_val = np.max(np.abs(audio)) if len(audio) else 0
+    return audio / max_val if max_val > 0 else audio
+
+
+def block_embeddings(yamnet_model, block: np.ndarray, block_start: float, starts: List[float],
+                     window: float, sample_rate: int, exact: bool = True) -> np.ndarray:
+    """
+    YAMNet embedding for each window of a block
+
+    Returns:
+        Array of shape (len(starts), 1024)
+    """
+    if exact:
+        rows = []
+        for start in starts:
+            offset = int((start - block_start) * sample_rate)
+            clip = normalize_peak(block[offset:offset + int(window * sample_rate)]).astype(np.float32)
+            _, embeddings, _ = yamnet_model(clip)
+            rows.append(np.mean(embeddings.numpy(), axis=0))
+        return np.array(rows, dtype=np.float32)
+
+    _, frames, _ = yamnet_model(normalize_peak(block).astype(np.float32))
+    frames = frames.numpy()
+    # Prefix sums make every window mean O(1)
+    cumulative = np.vstack([np.zeros((1, frames.shape[1]), dtype=np.float64), np.cumsum(frames, axis=0, dtype=np.float64)])
+    frame_starts = np.arange(len(frames)) * YAMNET_HOP_SECONDS
+
+    rows = []
+    for start in starts:
+        relative = start - block_start
+        inside = np.nonzero((frame_starts >= relative - 1e-6) & (frame_starts + YAMNET_FRAME_SECONDS <= relative + window + 1e-6))[0]
+        if len(inside) == 0:
+            # Window shorter than a frame span: use the frame nearest its start
+            inside = np.array([min(int(round(relative / YAMNET_HOP_SECONDS)), len(frames) - 1)])
+        first, last = inside[0], inside[-1] + 1
+        rows.append((cumulative[last] - cumulative[first]) / (last - first))
+    return np.array(rows, dtype=np.float32)
+
+
+class CsvDetectionWriter:
+    """Append detections to a CSV file; truncates back to the last checkpoint on resume"""
+
+    def __init__(self, path: str, committed_bytes: int):
+        self.path = path
+        if os.path.exists(path):
+            # Drop rows written after the last checkpoint (all rows on a fresh scan)
+            with open(path, "r+b") as f:
+                f.truncate(committed_bytes)
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="")
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(OUTPUT_COLUMNS)
+            self._file.flush()
+
+    def write(self, rows: List[Dict[str, Any]]):
+        self._writer.writerows([row[c] for c in OUTPUT_COLUMNS] for row in rows)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def state(self) -> Dict[str, Any]:
+        return {"output_bytes": self._file.tell()}
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetDetectionWriter:
+    """
+    Write detections as a directory of Parquet part files
+
+    A part is written at every checkpoint, so a crash can only lose the
+    rows since the last one; parts not recorded in the checkpoint are
+    removed on resume.
+    """
+
+    def __init__(self, path: str, committed_parts: List[str]):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise SystemExit("Parquet output requires pyarrow: pip install pyarrow")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.parts = list(committed_parts)
+        for name in os.listdir(path):
+            if name.endswith(".parquet") and name not in self.parts:
+                os.remove(os.path.join(path, name))
+
+    def write(self, rows: List[Dict[str, Any]]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not rows:
+            return
+        name = f"part-{len(self.parts):05d}.parquet"
+        table = pa.table({c: [row[c] for row in rows] for c in OUTPUT_COLUMNS})
+        pq.write_table(table, os.path.join(self.path, name))
+        self.parts.append(name)
+
+    def state(self) -> Dict[str, Any]:
+        return {"parts": self.parts}
+
+    def close(self):
+        pass
+
+
+def load_checkpoint(path: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {"version": CHECKPOINT_VERSION, "config": config, "files": {}, "writer": {}, "audio_seconds": 0.0, "elapsed_seconds": 0.0}
+    with open(path, "r") as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("config") != config:
+        raise SystemExit(
+            f"Checkpoint {path} was written with different settings:\n  {checkpoint.get('config')}\n"
+            f"Rerun with the same settings, or delete the checkpoint and output to start over."
+        )
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Any]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_classifier(model_path: Optional[str]):
+    """Load YAMNet and the classifier the API would serve (or model_path)"""
+    import tensorflow_hub as hub
+    from model_registry import ModelRegistry, load_and_warm_model
+
+    if model_path is None:
+        registry = ModelRegistry(config.MODEL_REGISTRY_DIR)
+        version = registry.active_version()
+        model_path = registry.model_path(version) if version else config.KERAS_MODEL_PATH
+
+    logger.info(f"Loading YAMNet from {config.YAMNET_MODEL_URL} and classifier from {model_path}...")
+    classifier = load_and_warm_model(model_path, config.EMBEDDING_DIM, list(config.THREAT_CLASSES.values()))
+    return hub.load(config.YAMNET_MODEL_URL), classifier, model_path
+
+
+def scan(args):
+    window = float(config.MAX_DURATION)
+    sample_rate = config.SAMPLE_RATE
+    parquet = args.output.endswith(".parquet")
+    checkpoint_path = args.checkpoint or args.output.rstrip("/") + ".checkpoint.json"
+
+    yamnet_model, classifier, model_path = load_classifier(args.model)
+    settings = {
+        "root": os.path.abspath(args.root),
+        "model": os.path.abspath(model_path),
+        "window": window,
+        "hop": args.hop,
+        "block_seconds": args.block_seconds,
+        "min_confidence": args.min_confidence,
+        "exact_windows": not args.fast_windows,
+    }
+    checkpoint = load_checkpoint(checkpoint_path, settings)
+    files = checkpoint["files"]
+
+    if parquet:
+        writer = ParquetDetectionWriter(args.output, checkpoint["writer"].get("parts", []))
+    else:
+        writer = CsvDetectionWriter(args.output, checkpoint["writer"].get("output_bytes", 0))
+
+    recordings = [r for r in find_recordings(args.root) if not files.get(r, {}).get("done")]
+    print(f"Found {len(recordings)} recording(s) left to scan under {args.root}"
+          f" ({sum(1 for f in files.values() if f.get('done'))} already done)")
+
+    def tasks():
+        """Blocks in scan order, starting after the last checkpointed block of each file"""
+        for relpath in recordings:
+            path = os.path.join(args.root, relpath)
+            try:
+                duration = audio_duration(path)
+            except Exception as e:
+                logger.error(f"Skipping unreadable {relpath}: {e}")
+                files[relpath] = {"next_block": 0, "done": True, "error": str(e)}
+                continue
+            blocks = max(1, int(np.ceil(duration / args.block_seconds)))
+            files.setdefault(relpath, {"next_block": 0, "done": False})["blocks"] = blocks
+            for block_index in range(files[relpath]["next_block"], blocks):
+                start = block_index * args.block_seconds
+                # Overlap by one window so windows starting near the block end are complete
+                yield relpath, path, block_index, start, args.block_seconds + window, sample_rate
+
+    pending_rows: List[Dict[str, Any]] = []
+    blocks_since_commit = 0
+    session_audio_seconds = 0.0
+    session_start = time.perf_counter()
+    previous_elapsed = checkpoint["elapsed_seconds"]
+
+    def commit():
+        nonlocal blocks_since_commit
+        writer.write(pending_rows)
+        pending_rows.clear()
+        blocks_since_commit = 0
+        checkpoint["writer"] = writer.state()
+        checkpoint["elapsed_seconds"] = previous_elapsed + time.perf_counter() - session_start
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        elapsed = time.perf_counter() - session_start
+        # Seconds of audio per second of wall time == hours of audio per hour
+        rate = session_audio_seconds / elapsed if elapsed > 0 else 0.0
+        print(f"  {checkpoint['audio_seconds'] / 3600:8.2f} h scanned | {rate:7.1f} h audio / h")
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        in_flight = deque()
+        task_iter = iter(tasks())
+
+        def fill():
+            # Bounded read-ahead keeps decoded blocks from piling up in memory
+            while len(in_flight) < args.workers * 2:
+                task = next(task_iter, None)
+                if task is None:
+                    return
+                in_flight.append(pool.submit(_decode_task, task))
+
+        fill()
+        while in_flight:
+            relpath, block_index, start, block, error = in_flight.popleft().result()
+            fill()
+            state = files[relpath]
+
+            if error is not None:
+                logger.error(f"Skipping block {block_index} of {relpath}: {error}")
+                state.setdefault("errors", []).append({"block": block_index, "error": error})
+                block = np.zeros(0, dtype=np.float32)
+
+            available = len(block) / sample_rate
+            starts = window_starts(start, args.block_seconds, available, window, args.hop)
+            if starts:
+                embeddings = block_embeddings(yamnet_model, block, start, starts, window, sample_rate, not args.fast_windows)
+                probabilities = np.vstack([
+                    classifier.predict(embeddings[i:i + args.batch_size], verbose=0)
+                    for i in range(0, len(embeddings), args.batch_size)
+                ])
+                for window_start, probs in zip(starts, probabilities):
+                    predicted_idx = int(np.argmax(probs))
+                    if probs[predicted_idx] < args.min_confidence:
+                        continue
+                    predicted_class = config.THREAT_CLASSES[predicted_idx]
+                    pending_rows.append({
+                        "file": relpath,
+                        "offset_seconds": round(window_start, 3),
+                        "duration_seconds": round(min(window, available - (window_start - start)), 3),
+                        "predicted_class": predicted_class,
+                        "confidence": float(probs[predicted_idx]),
+                        "priority": config.PRIORITY_MAP[predicted_class],
+                    })
+
+            block_audio = min(args.block_seconds, available)
+            session_audio_seconds += block_audio
+            checkpoint["audio_seconds"] += block_audio
+            state["next_block"] = block_index + 1
+            state["done"] = state["next_block"] >= state["blocks"]
+
+            blocks_since_commit += 1
+            if blocks_since_commit >= args.checkpoint_every:
+                commit()
+
+    commit()
+    writer.close()
+
+    elapsed = time.perf_counter() - session_start
+    print("\n" + "=" * 70)
+    print("✓ SCAN COMPLETE")
+    print("=" * 70)
+    print(f"  Audio scanned this run: {session_audio_seconds / 3600:.2f} h in {elapsed / 60:.1f} min")
+    print(f"  Throughput: {session_audio_seconds / elapsed if elapsed > 0 else 0:.1f} hours of audio per hour")
+    print(f"  Detections: {args.output}")
+    failed = [relpath for relpath, state in files.items() if state.get("error") or state.get("errors")]
+    if failed:
+        print(f"  Files with read or decode errors: {len(failed)} (listed in {checkpoint_path})")
+    print("=" * 70)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scan a directory of field recordings for threats")
+    parser.add_argument("root", help="Directory tree of recordings")
+    parser.add_argument("--output", required=True, help="Detections file: .csv, or .parquet (a directory of part files)")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <output>.checkpoint.json)")
+    parser.add_argument("--model", default=None, help="Classifier .keras file (default: the API's active model)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Decoding processes")
+    parser.add_argument("--block-seconds", type=float, default=600.0, help="Audio decoded and embedded per block")
+    parser.add_argument("--hop", type=float, default=2.0, help="Seconds between window starts")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Windows per classifier call")
+    parser.add_argument("--min-confidence", type=float, default=0.5, help="Only write windows at or above this confidence")
+    parser.add_argument("--checkpoint-every", type=int, default=6, help="Blocks between checkpoints")
+    parser.add_argument("--fast-windows", action="store_true",
+                        help="Run YAMNet once per block and pool frames per window (faster, per-block normalization)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    scan(parse_args())
@@ -4,6 +4,7 @@ Test script for the EcoSight API
 import requests
 import numpy as np
 import soundfile as sf
+import struct
 import os
 
 # API endpoint
@@ -98,6 +99,83 @@ def test_predict(audio_file):
         print(f"❌ Prediction error: {e}")
         return False
 
+def create_test_pcm(duration=3, sample_rate=16000):
+    """Create raw 16kHz mono PCM16 bytes (no container)"""
+    t = np.linspace(0, duration, int(sample_rate * duration))
+    audio = 0.5 * np.sin(2 * np.pi * 440 * t)
+    return (audio * 32767).astype('<i2').tobytes()
+
+def test_predict_pcm():
+    """Test the raw PCM16 prediction endpoint"""
+    try:
+        response = requests.post(
+            f"{API_URL}/predict-pcm",
+            data=create_test_pcm(),
+            headers={'Content-Type': 'application/octet-stream'}
+        )
+        if response.status_code == 200:
+            result = response.json()
+            print(f"✅ PCM prediction successful: {result['predicted_class']} ({result['confidence']:.2%})")
+            return True
+        else:
+            print(f"❌ PCM prediction failed: {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+    except Exception as e:
+        print(f"❌ PCM prediction error: {e}")
+        return False
+
+def test_batch_predict_pcm():
+    """Test the length-prefixed PCM16 batch endpoint"""
+    try:
+        clips = [create_test_pcm(duration=d) for d in (1, 2, 3)]
+        body = b"".join(struct.pack('<I', len(clip)) + clip for clip in clips)
+        response = requests.post(
+            f"{API_URL}/batch-predict-pcm",
+            data=body,
+            headers={'Content-Type': 'application/octet-stream'}
+        )
+        if response.status_code == 200 and response.json()['total'] == len(clips):
+            print(f"✅ PCM batch prediction successful: {response.json()['total']} results")
+            return True
+        else:
+            print(f"❌ PCM batch prediction failed: {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+    except Exception as e:
+        print(f"❌ PCM batch prediction error: {e}")
+        return False
+
+def test_predict_embeddings():
+    """Test the float16 embedding endpoint, including NaN rejection"""
+    try:
+        embeddings = np.random.default_rng(0).random((4, 1024)).astype('<f2')
+        response = requests.post(
+            f"{API_URL}/predict-embeddings",
+            data=embeddings.tobytes(),
+            headers={'Content-Type': 'application/octet-stream'}
+        )
+        if response.status_code != 200 or response.json()['total'] != len(embeddings):
+            print(f"❌ Embedding prediction failed: {response.status_code}")
+            print(f"   Response: {response.text}")
+            return False
+        
+        embeddings[0, 0] = np.nan
+        response = requests.post(
+            f"{API_URL}/predict-embeddings",
+            data=embeddings.tobytes(),
+            headers={'Content-Type': 'application/octet-stream'}
+        )
+        if response.status_code != 400:
+            print(f"❌ NaN embeddings were not rejected: {response.status_code}")
+            return False
+        
+        print(f"✅ Embedding prediction successful: 4 results, NaN body rejected")
+        return True
+    except Exception as e:
+        print(f"❌ Embedding prediction error: {e}")
+        return False
+
 def main():
     """Run all tests"""
     print("=" * 50)
@@ -123,6 +201,14 @@ def main():
     audio_file = create_test_audio()
     test_predict(audio_file)
     
+    # Test 5: Raw PCM16 and embedding ingest
+    print("\n5️⃣ Testing Raw PCM16 Endpoints...")
+    test_predict_pcm()
+    test_batch_predict_pcm()
+    
+    print("\n6️⃣ Testing Embedding Endpoint...")
+    test_predict_embeddings()
+    
     # Cleanup
     if os.path.exists(audio_file):
         os.remove(audio_file)
@@ -0,0 +1,91 @@
+"""Edge cases of the raw PCM16 and float16 embedding body parsers"""
+
+import struct
+
+import numpy as np
+import pytest
+
+main = pytest.importorskip("main")
+from fastapi import HTTPException
+
+
+def record(payload: bytes) -> bytes:
+    return struct.pack("<I", len(payload)) + payload
+
+
+def test_split_length_prefixed_roundtrip():
+    body = record(b"\x01\x00\x02\x00") + record(b"") + record(b"\x03\x00")
+    assert main.split_length_prefixed(body) == [b"\x01\x00\x02\x00", b"", b"\x03\x00"]
+
+
+def test_split_length_prefixed_truncated_prefix():
+    with pytest.raises(HTTPException) as error:
+        main.split_length_prefixed(record(b"\x01\x00") + b"\x04\x00")
+    assert error.value.status_code == 400
+    assert "Truncated length prefix" in error.value.detail
+
+
+def test_split_length_prefixed_length_past_end():
+    with pytest.raises(HTTPException) as error:
+        main.split_length_prefixed(struct.pack("<I", 10) + b"abc")
+    assert error.value.status_code == 400
+    assert "declares 10 bytes" in error.value.detail
+
+
+def test_split_length_prefixed_too_many_records():
+    with pytest.raises(HTTPException) as error:
+        main.split_length_prefixed(record(b"\x00\x00") * (main.MAX_BATCH_RECORDS + 1))
+    assert error.value.status_code == 413
+
+
+def test_split_length_prefixed_stops_at_record_limit():
+    # A truncated prefix past the limit is never reached: the count fails first
+    body = record(b"") * (main.MAX_BATCH_RECORDS + 1) + b"\x01"
+    with pytest.raises(HTTPException) as error:
+        main.split_length_prefixed(body)
+    assert error.value.status_code == 413
+
+
+def test_preprocess_pcm16_rejects_odd_length():
+    with pytest.raises(HTTPException) as error:
+        main.preprocess_pcm16(b"\x00\x00\x00")
+    assert error.value.status_code == 400
+    assert "not a multiple" in error.value.detail
+
+
+def test_preprocess_pcm16_rejects_empty_body():
+    with pytest.raises(HTTPException) as error:
+        main.preprocess_pcm16(b"")
+    assert error.value.status_code == 400
+
+
+def embeddings_body(rows: int, fill: float = 0.5) -> bytes:
+    return np.full((rows, main.EMBEDDING_DIM), fill, dtype="<f2").tobytes()
+
+
+def test_parse_float16_embeddings():
+    embeddings = main.parse_float16_embeddings(embeddings_body(3))
+    assert embeddings.shape == (3, main.EMBEDDING_DIM)
+    assert embeddings.dtype == np.float32
+    assert np.allclose(embeddings, 0.5)
+
+
+def test_parse_float16_embeddings_rejects_partial_row():
+    with pytest.raises(HTTPException) as error:
+        main.parse_float16_embeddings(embeddings_body(1)[:-2])
+    assert error.value.status_code == 400
+
+
+def test_parse_float16_embeddings_rejects_nan():
+    body = bytearray(embeddings_body(2))
+    body[10:12] = np.array([np.nan], dtype="<f2").tobytes()
+    with pytest.raises(HTTPException) as error:
+        main.parse_float16_embeddings(bytes(body))
+    assert error.value.status_code == 400
+    assert "NaN" in error.value.detail
+
+
+def test_parse_float16_embeddings_too_many_rows():
+    with pytest.raises(HTTPException) as error:
+        main.parse_float16_embeddings(embeddings_body(main.MAX_BATCH_RECORDS + 1))
+    assert error.value.status_code == 413
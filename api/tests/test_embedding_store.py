@@ -0,0 +1,87 @@
+"""Crash recovery and search of the on-disk embedding store"""
+
+import os
+
+import numpy as np
+
+from embedding_store import IDS_FILE, VECTORS_FILE, EmbeddingStore
+
+DIM = 16
+
+
+def vectors(n: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, DIM)).astype(np.float32)
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> float:
+    return float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def test_append_and_reopen(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    data = vectors(3)
+    store.append(["a", "b", "c"], data)
+
+    reopened = EmbeddingStore(str(tmp_path), dim=DIM)
+    assert len(reopened) == 3
+    assert "b" in reopened
+    assert cosine(reopened.vector("b"), data[1]) > 0.999
+
+
+def test_recover_drops_partial_vector_row(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    data = vectors(2)
+    store.append(["a"], data[:1])
+    # Crash partway through the next vector write
+    with open(tmp_path / VECTORS_FILE, "ab") as f:
+        f.write(b"\x00" * 10)
+
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    assert os.path.getsize(tmp_path / VECTORS_FILE) == store.row_bytes
+    store.append(["b"], data[1:])
+    assert cosine(store.vector("a"), data[0]) > 0.999
+    assert cosine(store.vector("b"), data[1]) > 0.999
+
+
+def test_recover_drops_vector_without_id(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    data = vectors(3)
+    store.append(["a"], data[:1])
+    # Crash after the vector write but before its ID
+    with open(tmp_path / VECTORS_FILE, "ab") as f:
+        f.write(data[1].astype("<f2").tobytes())
+
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    assert len(store) == 1
+    store.append(["c"], data[2:])
+    assert cosine(store.vector("c"), data[2]) > 0.999
+
+
+def test_recover_drops_torn_id(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    data = vectors(3)
+    store.append(["a"], data[:1])
+    # Crash partway through the next ID write, after its vector
+    with open(tmp_path / VECTORS_FILE, "ab") as f:
+        f.write(data[1].astype("<f2").tobytes())
+    with open(tmp_path / IDS_FILE, "a") as f:
+        f.write("12")
+
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    assert len(store) == 1
+    store.append(["345"], data[2:])
+    assert "12345" not in store
+    assert cosine(store.vector("345"), data[2]) > 0.999
+
+
+def test_exact_search_finds_nearest(tmp_path):
+    store = EmbeddingStore(str(tmp_path), dim=DIM)
+    data = vectors(50)
+    store.append([str(i) for i in range(50)], data)
+
+    results, method = store.search(data[7], top_k=3, exact=True)
+    assert method == "exact"
+    assert results[0][0] == "7"
+
+    results, _ = store.search(data[7], top_k=3, exact=True, exclude_id="7")
+    assert "7" not in [detection_id for detection_id, _ in results]
@@ -0,0 +1,193 @@
+"""Job store state transitions and the worker pool, on plain sqlite3"""
+
+import io
+import os
+import sqlite3
+import threading
+
+import pytest
+from fastapi import UploadFile
+
+from jobs import JobStore, JobWorkerPool
+
+
+def make_job(store, job_id, n):
+    store.create_job(job_id, [{"filename": f"{i}.wav", "spool_path": f"/spool/{job_id}/{i}"} for i in range(n)], 1.0, 2.0)
+
+
+def detection(file_index):
+    return {
+        "file_index": file_index,
+        "detection_id": f"d{file_index}",
+        "predicted_class": "gun_shot",
+        "confidence": 0.9,
+        "priority": "CRITICAL",
+        "all_predictions": {"gun_shot": 0.9, "dog_bark": 0.1},
+    }
+
+
+def test_claim_marks_files_processing_and_job_running(tmp_path):
+    store = JobStore(str(tmp_path))
+    make_job(store, "a", 5)
+
+    claimed = store.claim_batch(2)
+    assert claimed["job"]["id"] == "a"
+    assert [f["file_index"] for f in claimed["files"]] == [0, 1]
+    assert all(f["status"] == "processing" for f in claimed["files"])
+
+    job = store.get_job("a")
+    assert job["status"] == "running"
+    assert job["files"] == {"queued": 3, "processing": 2, "done": 0, "error": 0}
+
+
+def test_claims_oldest_job_first(tmp_path):
+    store = JobStore(str(tmp_path))
+    make_job(store, "first", 1)
+    make_job(store, "second", 1)
+
+    assert store.claim_batch(10)["job"]["id"] == "first"
+    assert store.claim_batch(10)["job"]["id"] == "second"
+    assert store.claim_batch(10) is None
+
+
+def test_job_completes_when_last_file_recorded(tmp_path):
+    store = JobStore(str(tmp_path))
+    make_job(store, "a", 3)
+
+    store.claim_batch(2)
+    assert store.record_results("a", [detection(0), {"file_index": 1, "error": "bad audio"}]) is False
+    store.claim_batch(2)
+    assert store.record_results("a", [detection(2)]) is True
+
+    job = store.get_job("a")
+    assert job["status"] == "completed"
+    assert job["finished_at"] is not None
+    assert job["files"] == {"queued": 0, "processing": 0, "done": 2, "error": 1}
+
+
+def test_empty_error_message_is_still_an_error(tmp_path):
+    store = JobStore(str(tmp_path))
+    make_job(store, "a", 1)
+    store.claim_batch(1)
+
+    store.record_results("a", [{"file_index": 0, "error": ""}])
+    assert store.results("a", 0, 10)[0]["status"] == "error"
+
+
+def test_requeue_interrupted(tmp_path):
+    store = JobStore(str(tmp_path))
+    make_job(store, "a", 3)
+    store.claim_batch(2)
+    store.close()
+
+    # Restart: the two files that were mid-batch are queued again
+    store = JobStore(str(tmp_path))
+    assert store.requeue_interrupted() == 2
+    assert store.get_job("a")["files"]["queued"] == 3
+    assert [f["file_index"] for f in store.claim_batch(10)["files"]] == [0, 1, 2]
+
+
+def test_results_paging(tmp_path):
+    store = JobStore(str(tmp_path))
+    make_job(store, "a", 5)
+    store.claim_batch(5)
+    store.record_results("a", [detection(i) for i in range(3)])
+
+    page = store.results("a", 2, 2)
+    assert [r["file_index"] for r in page] == [2, 3]
+    assert page[0]["all_predictions"] == {"gun_shot": 0.9, "dog_bark": 0.1}
+    assert page[1]["status"] == "processing"
+    assert page[1]["predicted_class"] is None
+    assert store.results("a", 5, 2) == []
+    assert store.get_job("missing") is None
+
+
+def test_worker_pool_processes_every_file_in_batches(tmp_path):
+    store = JobStore(str(tmp_path))
+    make_job(store, "a", 7)
+    (tmp_path / "spool" / "a").mkdir(parents=True)
+    batches = []
+    done = threading.Event()
+
+    def process_batch(job, files):
+        batches.append(len(files))
+        return [detection(f["file_index"]) for f in files]
+
+    remove_spool = store.remove_spool
+
+    def remove_spool_and_signal(job_id):
+        # The pool removes a job's spool right after completing it
+        remove_spool(job_id)
+        done.set()
+
+    store.remove_spool = remove_spool_and_signal
+    pool = JobWorkerPool(store, process_batch, workers=2, batch_size=3)
+    pool.start()
+    try:
+        assert done.wait(5)
+    finally:
+        pool.stop()
+
+    assert sorted(batches) == [1, 3, 3]
+    assert store.get_job("a")["files"]["done"] == 7
+    assert not (tmp_path / "spool" / "a").exists()
+
+
+def test_worker_pool_batch_failure_fails_only_its_files(tmp_path):
+    store = JobStore(str(tmp_path))
+    make_job(store, "a", 2)
+    done = threading.Event()
+
+    def process_batch(job, files):
+        if files[0]["file_index"] == 0:
+            raise RuntimeError()
+        done.set()
+        return [detection(f["file_index"]) for f in files]
+
+    pool = JobWorkerPool(store, process_batch, workers=1, batch_size=1)
+    pool.start()
+    try:
+        assert done.wait(5)
+    finally:
+        pool.stop()
+
+    results = store.results("a", 0, 10)
+    assert results[0]["status"] == "error"
+    assert results[0]["error"] == "RuntimeError"
+
+
+def test_stop_waits_for_running_batch(tmp_path):
+    store = JobStore(str(tmp_path))
+    make_job(store, "a", 1)
+    started, release = threading.Event(), threading.Event()
+
+    def process_batch(job, files):
+        started.set()
+        release.wait(5)
+        return [detection(f["file_index"]) for f in files]
+
+    pool = JobWorkerPool(store, process_batch, workers=1, batch_size=1)
+    pool.start()
+    assert started.wait(5)
+    assert not pool.stop(timeout=0.1)
+
+    release.set()
+    assert pool.stop(timeout=5)
+    assert store.get_job("a")["status"] == "completed"
+
+
+def test_submit_removes_spool_when_job_cannot_be_recorded(tmp_path, monkeypatch):
+    main = pytest.importorskip("main")
+    store = JobStore(str(tmp_path))
+
+    def fail(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(store, "create_job", fail)
+    monkeypatch.setattr(main, "job_store", store)
+    monkeypatch.setattr(main, "keras_classifier", object())
+    upload = UploadFile(file=io.BytesIO(b"RIFF"), filename="a.wav", size=4)
+
+    with pytest.raises(sqlite3.OperationalError):
+        main.submit_job([upload])
+    assert os.listdir(tmp_path / "spool") == []
@@ -0,0 +1,45 @@
+"""Classifier versions must match the API's classes before they serve traffic"""
+
+import json
+import os
+
+import pytest
+
+from model_registry import METADATA_FILE, check_model_classes
+
+CLASSES = ["gun_shot", "human_voices", "engine_idling", "dog_bark"]
+
+
+class ShapedModel:
+    def __init__(self, outputs):
+        self.output_shape = (None, outputs)
+
+
+def model_path(tmp_path, metadata=None) -> str:
+    if metadata is not None:
+        with open(os.path.join(tmp_path, METADATA_FILE), "w") as f:
+            json.dump(metadata, f)
+    return os.path.join(tmp_path, "model.keras")
+
+
+def test_accepts_matching_outputs_without_metadata(tmp_path):
+    check_model_classes(ShapedModel(4), model_path(tmp_path), CLASSES)
+
+
+def test_accepts_matching_class_names(tmp_path):
+    check_model_classes(ShapedModel(4), model_path(tmp_path, {"class_names": CLASSES}), CLASSES)
+
+
+def test_rejects_extra_output(tmp_path):
+    with pytest.raises(ValueError, match="5 outputs"):
+        check_model_classes(ShapedModel(5), model_path(tmp_path), CLASSES)
+
+
+def test_rejects_reordered_class_names(tmp_path):
+    sorted_names = sorted(CLASSES)
+    with pytest.raises(ValueError, match="do not match"):
+        check_model_classes(ShapedModel(4), model_path(tmp_path, {"class_names": sorted_names}), CLASSES)
+
+
+def test_ignores_metadata_without_class_names(tmp_path):
+    check_model_classes(ShapedModel(4), model_path(tmp_path, {"notes": "v3"}), CLASSES)
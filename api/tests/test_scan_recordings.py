@@ -0,0 +1,204 @@
+"""Scanner windowing, output writers, checkpoints and resume"""
+
+import csv
+import json
+import os
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import scan_recordings
+from scan_recordings import (
+    MIN_WINDOW_SECONDS,
+    YAMNET_FRAME_SECONDS,
+    YAMNET_HOP_SECONDS,
+    CsvDetectionWriter,
+    block_embeddings,
+    load_checkpoint,
+    save_checkpoint,
+    window_starts,
+)
+
+SAMPLE_RATE = 16000
+
+
+def test_window_starts_cover_block():
+    assert window_starts(600.0, 10.0, 14.0, 4.0, 2.0) == [600.0, 602.0, 604.0, 606.0, 608.0]
+
+
+def test_window_starts_skip_short_tail():
+    # 5s of audio: the window at 4s would only hold 1s, at 4.5s less than a frame
+    starts = window_starts(0.0, 10.0, 5.0, 4.0, 0.5)
+    assert starts[-1] == 4.0
+    assert 5.0 - starts[-1] >= MIN_WINDOW_SECONDS
+
+
+def test_window_starts_empty_block():
+    assert window_starts(0.0, 10.0, 0.0, 4.0, 2.0) == []
+
+
+class Frames:
+    def __init__(self, values):
+        self.values = values
+
+    def numpy(self):
+        return self.values
+
+
+class FrameModel:
+    """Stands in for YAMNet: one embedding frame per hop, recording the clips it was given"""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, waveform):
+        self.calls.append(waveform)
+        frames = max(1, int((len(waveform) / SAMPLE_RATE - YAMNET_FRAME_SECONDS) / YAMNET_HOP_SECONDS) + 1)
+        values = np.arange(frames, dtype=np.float32)[:, None] * np.ones((1, 1024), dtype=np.float32)
+        return None, Frames(values), None
+
+
+def test_fast_windows_pool_frames_inside_each_window():
+    block = np.full(12 * SAMPLE_RATE, 0.25, dtype=np.float32)
+    starts = [100.0, 102.0, 104.0]
+    model = FrameModel()
+    embeddings = block_embeddings(model, block, 100.0, starts, 4.0, SAMPLE_RATE, exact=False)
+
+    assert len(model.calls) == 1
+    assert embeddings.shape == (3, 1024)
+    frame_starts = np.arange(int((12 - YAMNET_FRAME_SECONDS) / YAMNET_HOP_SECONDS) + 1) * YAMNET_HOP_SECONDS
+    for row, start in zip(embeddings, starts):
+        relative = start - 100.0
+        inside = np.nonzero((frame_starts >= relative - 1e-6)
+                            & (frame_starts + YAMNET_FRAME_SECONDS <= relative + 4.0 + 1e-6))[0]
+        assert np.allclose(row, inside.mean())
+
+
+def test_exact_windows_embed_each_window_normalized():
+    block = np.concatenate([np.full(4 * SAMPLE_RATE, 0.1), np.full(4 * SAMPLE_RATE, 0.8)]).astype(np.float32)
+    model = FrameModel()
+    block_embeddings(model, block, 0.0, [0.0, 4.0], 4.0, SAMPLE_RATE, exact=True)
+
+    assert len(model.calls) == 2
+    assert all(len(clip) == 4 * SAMPLE_RATE for clip in model.calls)
+    # Each window is peak-normalized on its own, as /predict does
+    assert all(np.allclose(clip, 1.0) for clip in model.calls)
+
+
+def detection(offset):
+    return {"file": "a.wav", "offset_seconds": offset, "duration_seconds": 4.0,
+            "predicted_class": "gun_shot", "confidence": 0.9, "priority": "CRITICAL"}
+
+
+def read_offsets(path):
+    with open(path, newline="") as f:
+        return [float(row["offset_seconds"]) for row in csv.DictReader(f)]
+
+
+def test_csv_writer_truncates_to_committed_bytes(tmp_path):
+    path = str(tmp_path / "detections.csv")
+    writer = CsvDetectionWriter(path, 0)
+    writer.write([detection(0.0), detection(2.0)])
+    committed = writer.state()["output_bytes"]
+    writer.write([detection(4.0)])  # never checkpointed
+    writer.close()
+
+    writer = CsvDetectionWriter(path, committed)
+    writer.write([detection(4.0)])
+    writer.close()
+    assert read_offsets(path) == [0.0, 2.0, 4.0]
+
+
+def test_csv_writer_starts_over_without_checkpoint(tmp_path):
+    path = str(tmp_path / "detections.csv")
+    writer = CsvDetectionWriter(path, 0)
+    writer.write([detection(0.0)])
+    writer.close()
+
+    CsvDetectionWriter(path, 0).close()
+    with open(path) as f:
+        assert f.read().splitlines() == [",".join(scan_recordings.OUTPUT_COLUMNS)]
+
+
+def test_parquet_writer_removes_uncommitted_parts(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "detections.parquet"
+    writer = scan_recordings.ParquetDetectionWriter(str(path), [])
+    writer.write([detection(0.0)])
+    committed = writer.state()["parts"]
+    writer.write([detection(2.0)])
+
+    writer = scan_recordings.ParquetDetectionWriter(str(path), committed)
+    assert sorted(os.listdir(path)) == committed
+    writer.write([detection(2.0)])
+    assert writer.state()["parts"] == ["part-00000.parquet", "part-00001.parquet"]
+
+
+def test_checkpoint_roundtrip_and_config_mismatch(tmp_path):
+    path = str(tmp_path / "scan.checkpoint.json")
+    settings = {"root": "/data", "hop": 2.0}
+    checkpoint = load_checkpoint(path, settings)
+    assert checkpoint["files"] == {}
+
+    checkpoint["files"]["a.wav"] = {"next_block": 1, "done": False}
+    save_checkpoint(path, checkpoint)
+    assert load_checkpoint(path, settings)["files"] == {"a.wav": {"next_block": 1, "done": False}}
+    assert not os.path.exists(path + ".tmp")
+
+    with pytest.raises(SystemExit):
+        load_checkpoint(path, {"root": "/data", "hop": 1.0})
+
+
+class ConstantClassifier:
+    """Always predicts gun_shot; optionally fails after a number of calls"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.calls = 0
+
+    def predict(self, embeddings, **kwargs):
+        self.calls += 1
+        if self.fail_after is not None and self.calls > self.fail_after:
+            raise KeyboardInterrupt
+        return np.tile([0.9, 0.05, 0.03, 0.02], (len(embeddings), 1))
+
+
+def run_scan(monkeypatch, root, output, classifier):
+    monkeypatch.setattr(scan_recordings, "load_classifier", lambda model: (FrameModel(), classifier, "model.keras"))
+    scan_recordings.scan(scan_recordings.parse_args([
+        str(root), "--output", str(output), "--workers", "1", "--block-seconds", "4",
+        "--hop", "2", "--checkpoint-every", "1", "--fast-windows",
+    ]))
+
+
+def read_rows(path):
+    with open(path, newline="") as f:
+        return [(row["file"], row["offset_seconds"]) for row in csv.DictReader(f)]
+
+
+def test_resume_after_interruption_has_no_duplicates(tmp_path, monkeypatch):
+    pytest.importorskip("librosa")
+    root = tmp_path / "recordings"
+    root.mkdir()
+    for name in ("a.wav", "b.wav"):
+        sf.write(str(root / name), np.full(10 * SAMPLE_RATE, 0.2, dtype=np.float32), SAMPLE_RATE)
+    (root / "broken.wav").write_bytes(b"not audio")
+
+    expected = tmp_path / "expected.csv"
+    run_scan(monkeypatch, root, expected, ConstantClassifier())
+
+    output = tmp_path / "detections.csv"
+    with pytest.raises(KeyboardInterrupt):
+        run_scan(monkeypatch, root, output, ConstantClassifier(fail_after=4))
+    partial = read_rows(output)
+    assert 0 < len(partial) < len(read_rows(expected))
+
+    run_scan(monkeypatch, root, output, ConstantClassifier())
+    rows = read_rows(output)
+    assert rows == read_rows(expected)
+    assert len(rows) == len(set(rows))
+
+    with open(str(output) + ".checkpoint.json") as f:
+        files = json.load(f)["files"]
+    assert files["broken.wav"]["done"] and "error" in files["broken.wav"]
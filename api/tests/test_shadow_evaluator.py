@@ -0,0 +1,32 @@
+"""Shadow evaluation must never affect the live request path"""
+
+import numpy as np
+
+from model_registry import ShadowEvaluator
+
+
+class ConstantModel:
+    def __init__(self, probabilities):
+        self.probabilities = np.asarray(probabilities, dtype=np.float32)
+
+    def predict(self, x, **kwargs):
+        return np.tile(self.probabilities, (len(x), 1))
+
+
+def test_submit_after_stop_is_ignored():
+    evaluator = ShadowEvaluator(ConstantModel([0.9, 0.1]), "candidate", fraction=1.0)
+    evaluator.stop()
+
+    evaluator.submit(np.zeros((2, 4)), np.array([[0.9, 0.1], [0.2, 0.8]]), 1.0)
+    assert evaluator.stats()["sampled_batches"] == 0
+    assert evaluator.stats()["errors"] == 0
+
+
+def test_submit_compares_against_active_predictions():
+    evaluator = ShadowEvaluator(ConstantModel([0.9, 0.1]), "candidate", fraction=1.0)
+    evaluator.submit(np.zeros((2, 4)), np.array([[0.9, 0.1], [0.2, 0.8]]), 1.0)
+    evaluator._executor.shutdown(wait=True)
+
+    stats = evaluator.stats()
+    assert stats["compared_predictions"] == 2
+    assert stats["agreement_rate"] == 0.5
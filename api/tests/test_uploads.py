@@ -0,0 +1,147 @@
+"""Upload size limits, bounded body reads and block-wise decoding"""
+
+import asyncio
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+main = pytest.importorskip("main")
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def small_limits(monkeypatch):
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 1000)
+    monkeypatch.setattr(main, "MULTIPART_OVERHEAD_BYTES", 500)
+
+
+@pytest.fixture
+def upload_app():
+    app = FastAPI()
+    app.state.calls = 0
+
+    @app.post("/predict")
+    async def upload(file: UploadFile = File(...)):
+        app.state.calls += 1
+        return {"size": file.size}
+
+    app.add_middleware(main.UploadLimitMiddleware)
+    return app
+
+
+def test_middleware_passes_uploads_under_limit(small_limits, upload_app):
+    response = TestClient(upload_app).post("/predict", files={"file": ("a.wav", b"x" * 800, "audio/wav")})
+    assert response.status_code == 200
+    assert response.json() == {"size": 800}
+
+
+def test_middleware_rejects_declared_length(small_limits, upload_app):
+    response = TestClient(upload_app).post("/predict", files={"file": ("a.wav", b"x" * 5000, "audio/wav")})
+    assert response.status_code == 413
+    assert upload_app.state.calls == 0
+
+
+def test_middleware_cuts_off_chunked_body(small_limits, upload_app):
+    def chunks():
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.wav"\r\n'
+        yield b"Content-Type: audio/wav\r\n\r\n"
+        for _ in range(10):
+            yield b"x" * 400
+        yield b"\r\n--b--\r\n"
+
+    response = TestClient(upload_app).post(
+        "/predict", content=chunks(), headers={"content-type": "multipart/form-data; boundary=b"}
+    )
+    assert response.status_code == 413
+    assert upload_app.state.calls == 0
+
+
+def body_request(chunks, content_length=None) -> Request:
+    headers = [] if content_length is None else [(b"content-length", str(content_length).encode())]
+    messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+
+    async def receive():
+        return messages.pop(0)
+
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": headers}, receive)
+
+
+def test_read_body_limited_reads_whole_body():
+    tracker = main.MemoryTracker()
+    body = asyncio.run(main.read_body_limited(body_request([b"ab", b"cd"]), 10, tracker))
+    assert body == b"abcd"
+    assert tracker.current == 4
+
+
+def test_read_body_limited_rejects_declared_length():
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.read_body_limited(body_request([b"ab"], content_length=100), 10, main.MemoryTracker()))
+    assert error.value.status_code == 413
+
+
+def test_read_body_limited_rejects_streamed_overflow():
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.read_body_limited(body_request([b"x" * 6, b"x" * 6]), 10, main.MemoryTracker()))
+    assert error.value.status_code == 413
+
+
+def test_read_body_limited_stop_after_truncates():
+    tracker = main.MemoryTracker()
+    # stop_after ignores the overall limit: only the leading window is kept
+    request = body_request([b"x" * 6, b"y" * 6, b"z" * 6], content_length=18)
+    body = asyncio.run(main.read_body_limited(request, 10, tracker, stop_after=8))
+    assert body == b"x" * 6 + b"y" * 2
+    assert tracker.current == 8
+    assert tracker.peak == 12
+
+
+def wav_upload(seconds: float, sample_rate: int = 16000, channels: int = 1) -> UploadFile:
+    samples = np.linspace(-0.5, 0.5, int(seconds * sample_rate) * channels, dtype=np.float32)
+    buffer = io.BytesIO()
+    sf.write(buffer, samples.reshape(-1, channels), sample_rate, format="WAV", subtype="PCM_16")
+    buffer.seek(0)
+    return UploadFile(file=buffer, filename="clip.wav", size=len(buffer.getvalue()))
+
+
+def test_decode_upload_stops_at_analysis_window():
+    tracker = main.MemoryTracker()
+    audio = main.decode_upload(wav_upload(main.MAX_DURATION * 3), tracker)
+    window = main.SAMPLE_RATE * main.MAX_DURATION
+    assert audio.shape == (window,)
+    assert tracker.current == audio.nbytes
+    # The window plus the blocks being joined, never the whole clip
+    assert tracker.peak <= 2 * audio.nbytes + main.DECODE_BLOCK_FRAMES * 4
+
+
+def test_decode_upload_downmixes_to_mono():
+    audio = main.decode_upload(wav_upload(1, channels=2), main.MemoryTracker())
+    assert audio.shape == (main.SAMPLE_RATE,)
+
+
+def test_preprocess_upload_releases_samples(monkeypatch):
+    monkeypatch.setattr(main, "extract_embedding", lambda audio: audio[:4].reshape(1, -1))
+    tracker = main.MemoryTracker()
+    main.preprocess_upload(wav_upload(1), tracker)
+    single_peak = tracker.peak
+    for _ in range(4):
+        main.preprocess_upload(wav_upload(1), tracker)
+    assert tracker.current == 0
+    assert tracker.peak == single_peak
+
+
+def test_preprocess_upload_rejects_oversized_file():
+    upload = wav_upload(1)
+    with pytest.raises(HTTPException) as error:
+        main.preprocess_upload(upload, main.MemoryTracker(), limit=upload.size - 1)
+    assert error.value.status_code == 413
+
+
+def test_bounded_reader_stops_at_limit():
+    reader = main.BoundedReader(io.BytesIO(b"x" * 100), 60)
+    assert len(reader.read(1000)) == 60
+    assert reader.read(10) == b""
+    assert reader.bytes_read == 60